@@ -4,9 +4,10 @@ import threading
 import os
 import sys
 import subprocess
-from PIL import Image, ImageTk
+from PIL import Image, ImageTk, ImageOps
 import hashlib
-from collections import defaultdict
+import io
+from collections import defaultdict, namedtuple, OrderedDict
 from pathlib import Path
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, landscape
@@ -18,21 +19,118 @@ from reportlab.platypus import (
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT
 from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
 import pandas as pd
+import numpy as np
 from PyPDF2 import PdfMerger
 import re
 from datetime import datetime
 from PIL.ExifTags import TAGS as ExifTags
 import time
 import zipfile
+import zlib
 import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
 import json
+import sqlite3
+import mmap
+import argparse
+import functools
+import random
+import gzip
+import csv
+import uuid
+import errno
+import stat
+import filecmp
+import ctypes
+import html
+import logging
+from logging.handlers import RotatingFileHandler
+try:
+    import fcntl  # Solo en sistemas Unix, para reflinks en Linux
+except ImportError:
+    fcntl = None
 
 # === Constantes y configuración ===
-HASH_CACHE_FILE = "hash_cache.json"
+HASH_CACHE_FILE = "hash_cache.json"  # Formato heredado, se importa una sola vez
+HASH_CACHE_DB = "hash_cache.db"
+ROOT_MARKER_FILE = ".fttxg_raiz"  # Identificador del árbol de trabajo, viaja con la carpeta base
+CACHE_BUNDLE_FORMAT = "fttxg-hash-cache"
+HASH_CACHE_BATCH = 500           # Entradas pendientes antes de escribir un lote
+HASH_CACHE_FLUSH_SECONDS = 5.0   # Tiempo máximo que una entrada espera en memoria
+PARTIAL_HASH_BLOCK = 65536       # Bytes leídos al inicio y al final en el hash parcial
+HASH_ALGORITHMS = {
+    "md5": hashlib.md5,
+    "sha256": hashlib.sha256,
+    "blake2b": functools.partial(hashlib.blake2b, digest_size=32),
+}
+HASH_READ_STRATEGIES = ("buffered", "mmap", "readinto")
+DEFAULT_HASH_ALGORITHM = "md5"
+DEFAULT_HASH_STRATEGY = "buffered"
+DEFAULT_HASH_BLOCK_SIZE = 65536
+PERCEPTUAL_METHODS = ("dhash", "phash")  # Huellas de 64 bits guardadas junto al hash de contenido
+DEFAULT_PERCEPTUAL_METHOD = "dhash"
+DEFAULT_SIMILARITY_THRESHOLD = 8         # Distancia de Hamming máxima para considerar fotos similares
+SCAN_EXCLUDED_DIRS = ("imagenes_temp", "reportes_duplicados")  # Carpetas que no se recorren al buscar imágenes
+SCAN_INFLIGHT_PER_WORKER = 4             # Tareas en vuelo por hilo de trabajo durante el análisis
+REPORTS_DIRNAME = "reportes_duplicados"
+RECLAIM_METHODS = ("auto", "hardlink", "reflink")  # auto: reflink si el disco lo admite, si no enlace duro
+DEFAULT_RECLAIM_METHOD = "auto"
+RECLAIM_JOURNAL_PREFIX = "enlaces_"      # Diarios para deshacer los enlaces de duplicados
+FICLONE = 0x40049409                     # ioctl de Linux para reflinks
+UI_REFRESH_MS = 50                       # Intervalo con que la interfaz aplica el progreso de los hilos (20 Hz)
+LOG_FILE = "maintool.log"
+LOG_MAX_BYTES = 2 * 1024 * 1024          # Tamaño de cada archivo de bitácora antes de rotar
+LOG_BACKUP_COUNT = 3
+LOG_CONSOLE_MAX_LINES = 2000             # Líneas que conserva cada consola de la interfaz
 APP_CONFIG_FILE = "fttxg_config.json"
 HTML_REPORT_NAME = "reporte_duplicados.html"
+REPORT_GROUPS_PER_PAGE = 50              # Grupos por página del reporte HTML de duplicados
+REPORT_THUMB_SIZE = 160                  # Lado máximo de las miniaturas del reporte
+THUMB_CACHE_DIR = "thumb_cache"
+THUMB_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Espacio máximo del caché de miniaturas
+REVIEW_THUMBNAIL_WORKERS = 4             # Hilos que cargan miniaturas en la ventana de revisión
+REVIEW_THUMBNAILS_IN_MEMORY = 120        # Miniaturas que la ventana de revisión conserva en memoria
+REPORT_WORKERS = max(1, min(os.cpu_count() or 1, 61))  # Procesos para generar informes (61: límite de Windows)
+REPORT_INFLIGHT_PER_WORKER = 2           # Estaciones enviadas por proceso, para cancelar sin esperar la cola
+REPORT_RESIZE_WORKERS = os.cpu_count() or 1  # Hilos que redimensionan las fotos de una estación
+REPORT_IMAGE_CACHE_DIR = "report_image_cache"
+REPORT_IMAGE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Espacio máximo de las fotos ya redimensionadas para informes
+REPORT_PROFILES = {  # Fotos: resolución, calidad JPEG y submuestreo; fondos: dpi y calidad (None = archivo original)
+    "borrador": {"max_size": (200, 300), "quality": 60, "subsampling": 2, "optimize": False,
+                 "fondo_dpi": 100, "fondo_calidad": 75},
+    "correo": {"max_size": (300, 450), "quality": 75, "subsampling": 2, "optimize": True,
+               "fondo_dpi": 150, "fondo_calidad": 85},
+    "archivo": {"max_size": (400, 600), "quality": 100, "subsampling": 0, "optimize": True,
+                "fondo_dpi": None, "fondo_calidad": None},  # Ajuste histórico
+}
+DEFAULT_REPORT_PROFILE = "archivo"
+REPORT_PDF_OVERHEAD_BYTES = 64 * 1024    # Margen para texto y estructura del PDF al buscar un tamaño objetivo
+ZIP_SAMPLE_BYTES = 256 * 1024            # Bytes de cada PDF que se comprimen de prueba antes de agregarlo al ZIP
+ZIP_MIN_SAVINGS = 0.05                   # Ahorro mínimo en la prueba para usar DEFLATE; si no, se guarda sin comprimir
+ZIP_ENTRY_OVERHEAD = 1024                # Margen por entrada (cabeceras y directorio) al repartir en volúmenes
+REPORT_MANIFEST_VERSION = 1              # Subir al cambiar la maquetación para regenerar todos los informes
+REPORT_ASSETS = {  # Recursos compartidos por todos los informes de un lote, relativos a la carpeta base
+    "fondo_portada": "fondo_portada.jpg",
+    "fondo_paginas": "fondo_paginas.jpg",
+    "imagen_final": "imagen_final.jpg",
+}
+REPORT_STYLE = (
+    "body { font-family: Arial, sans-serif; margin: 20px; }"
+    " .grupo { border: 1px solid #ddd; padding: 15px; margin-bottom: 20px; border-radius: 5px; }"
+    " .foto { display: inline-block; vertical-align: top; width: 220px; margin: 10px 10px 0 0; padding: 10px;"
+    " background-color: #f9f9f9; border-left: 4px solid #4CAF50; }"
+    " h1 { color: #333; } h2 { color: #444; }"
+    " .hash { font-family: monospace; color: #666; }"
+    " .estacion { font-weight: bold; color: #2c3e50; }"
+    " .subcarpeta { color: #7f8c8d; }"
+    " .ruta { font-size: 11px; color: #7f8c8d; word-break: break-all; }"
+    " .nav a { margin-right: 8px; }"
+    " table { border-collapse: collapse; } td, th { border: 1px solid #ddd; padding: 6px 10px; text-align: left; }"
+    " img { max-width: 160px; max-height: 160px; }"
+)
 IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp")
 EXCEL_FILENAME = "estaciones.xlsx"
 SUBCARPETAS = [
@@ -65,10 +163,2510 @@ SUBCARPETAS = [
 ]
 DEFAULT_APPEARANCE = "Dark"
 
+
+def load_config():
+    """Lee el archivo de configuración persistente."""
+    config_path = Path(APP_CONFIG_FILE)
+    if config_path.exists():
+        try:
+            with config_path.open("r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (json.JSONDecodeError, OSError):
+            return {}
+    return {}
+
+
+def save_config(preferences):
+    """Escribe el archivo de configuración persistente."""
+    config_path = Path(APP_CONFIG_FILE)
+    try:
+        with config_path.open("w", encoding="utf-8") as fh:
+            json.dump(preferences, fh, indent=2)
+    except OSError:
+        pass  # Evitar que un error silencie la UI
+
 # Apariencia por defecto
 ctk.set_appearance_mode(DEFAULT_APPEARANCE)
 ctk.set_default_color_theme("blue")
 
+
+def identificar_raiz(base):
+    """Devuelve el identificador estable del árbol de trabajo en base.
+
+    El identificador se guarda en un archivo marcador dentro de la carpeta, por
+    lo que se conserva al renombrarla, al cambiar el punto de montaje de la
+    unidad o al abrirla desde otro equipo que sincroniza la misma carpeta. Si
+    no se puede escribir el marcador se usa la ruta absoluta.
+    """
+    marcador = Path(base) / ROOT_MARKER_FILE
+    try:
+        identificador = marcador.read_text(encoding="utf-8").strip()
+        if identificador:
+            return identificador
+    except OSError:
+        pass
+    identificador = uuid.uuid4().hex
+    try:
+        marcador.write_text(identificador + "\n", encoding="utf-8")
+    except OSError:
+        return f"ruta:{os.path.abspath(base)}"
+    return identificador
+
+
+class HashCacheStore:
+    """Caché persistente de hashes respaldado por SQLite.
+
+    La base se abre de forma perezosa en el primer acceso y las escrituras se
+    agrupan en transacciones por lotes, de modo que el costo de abrir y guardar
+    no crece con el tamaño del caché y un cierre inesperado solo pierde el
+    último lote pendiente.
+
+    Las entradas se guardan por (raíz, ruta relativa): la raíz es el
+    identificador del árbol registrado con register_root y la ruta usa "/" como
+    separador, así el caché sigue sirviendo si la carpeta base se mueve o se
+    abre desde otro equipo. Las rutas fuera de toda raíz registrada (y las
+    heredadas de versiones anteriores) se guardan con raíz vacía y ruta
+    absoluta. Con identity_fallback, un archivo movido o renombrado dentro de
+    la misma raíz se reconoce por tamaño, mtime e inodo (los inodos solo son
+    únicos dentro de un disco, así que no se comparan entre raíces).
+    """
+
+    SCHEMA_VERSION = 4
+
+    def __init__(self, db_path=HASH_CACHE_DB, legacy_json=HASH_CACHE_FILE,
+                 batch_size=HASH_CACHE_BATCH, flush_seconds=HASH_CACHE_FLUSH_SECONDS,
+                 identity_fallback=True):
+        self.db_path = Path(db_path)
+        self.legacy_json = Path(legacy_json) if legacy_json else None
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.identity_fallback = identity_fallback
+        self._conn = None
+        self._lock = threading.RLock()
+        self._pending = {}  # {(raiz, ruta, algoritmo): (mtime, tamano, inode, hash)}
+        self._roots = {}    # {carpeta base absoluta: identificador de raíz}
+        self._last_flush = time.monotonic()
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        with conn:
+            if version in (1, 2):
+                conn.execute("ALTER TABLE hashes RENAME TO hashes_anterior")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                " raiz TEXT NOT NULL,"
+                " ruta TEXT NOT NULL,"
+                " algoritmo TEXT NOT NULL,"
+                " mtime REAL NOT NULL,"
+                " tamano INTEGER NOT NULL,"
+                " inode INTEGER,"
+                " hash TEXT NOT NULL,"
+                " PRIMARY KEY (raiz, ruta, algoritmo))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS hashes_identidad ON hashes (tamano, mtime, inode)"
+            )
+            if version in (1, 2):
+                # v1 no registraba el algoritmo (todo era MD5); v1 y v2 usaban rutas absolutas
+                algoritmo = "'md5'" if version == 1 else "algoritmo"
+                conn.execute(
+                    "INSERT INTO hashes (raiz, ruta, algoritmo, mtime, tamano, inode, hash)"
+                    f" SELECT '', ruta, {algoritmo}, mtime, tamano, NULL, hash FROM hashes_anterior"
+                )
+                conn.execute("DROP TABLE hashes_anterior")
+                # Las instantáneas por ruta absoluta se descartan: el próximo recorrido es completo
+                conn.execute("DROP TABLE IF EXISTS instantaneas")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS instantaneas ("
+                " raiz TEXT NOT NULL,"
+                " directorio TEXT NOT NULL,"
+                " mtime REAL NOT NULL,"
+                " subdirectorios TEXT NOT NULL,"
+                " archivos TEXT NOT NULL,"
+                " PRIMARY KEY (raiz, directorio))"
+            )
+            # v4: historial de meses registrados para buscar fotos reutilizadas
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meses ("
+                " raiz TEXT PRIMARY KEY,"
+                " nombre TEXT NOT NULL,"
+                " carpeta TEXT NOT NULL,"
+                " registrado REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS historial ("
+                " raiz TEXT NOT NULL,"
+                " ruta TEXT NOT NULL,"
+                " algoritmo TEXT NOT NULL,"
+                " tamano INTEGER NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " PRIMARY KEY (raiz, ruta, algoritmo))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS historial_hash ON historial (algoritmo, hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS historial_tamano ON historial (algoritmo, tamano)")
+        self._conn = conn
+        if version == 0:
+            self._import_legacy_json()
+        if version < self.SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        return conn
+
+    def _import_legacy_json(self):
+        """Importa el antiguo hash_cache.json (claves ruta_mtime_tamaño)."""
+        if not self.legacy_json or not self.legacy_json.exists():
+            return
+        try:
+            with self.legacy_json.open("r", encoding="utf-8") as fh:
+                legacy = json.load(fh)
+        except (json.JSONDecodeError, OSError):
+            return
+        filas = []
+        for key, hash_value in legacy.items():
+            try:
+                ruta, mtime, tamano = key.rsplit("_", 2)
+                filas.append(("", ruta, "md5", float(mtime), int(tamano), None, hash_value))
+            except ValueError:
+                continue
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO hashes (raiz, ruta, algoritmo, mtime, tamano, inode, hash)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                filas,
+            )
+
+    def register_root(self, base):
+        """Registra base como raíz de claves relativas y devuelve su identificador."""
+        base = os.path.abspath(base)
+        with self._lock:
+            if base not in self._roots:
+                self._roots[base] = identificar_raiz(base)
+            return self._roots[base]
+
+    def _clave(self, ruta):
+        """Traduce una ruta absoluta a (raíz, ruta relativa con "/").
+
+        Con raíces anidadas gana la más profunda.
+        """
+        ruta = str(ruta)
+        for base, raiz in sorted(self._roots.items(), key=lambda item: len(item[0]), reverse=True):
+            if ruta.startswith(base) and ruta[len(base):len(base) + 1] in (os.sep, "/"):
+                return raiz, ruta[len(base) + 1:].replace(os.sep, "/")
+        return "", ruta
+
+    def _leer(self, raiz, ruta, algoritmo):
+        pendiente = self._pending.get((raiz, ruta, algoritmo))
+        if pendiente is not None:
+            return pendiente
+        return self._connect().execute(
+            "SELECT mtime, tamano, inode, hash FROM hashes WHERE raiz = ? AND ruta = ? AND algoritmo = ?",
+            (raiz, ruta, algoritmo),
+        ).fetchone()
+
+    def get(self, ruta, mtime, tamano, algoritmo=DEFAULT_HASH_ALGORITHM, inode=None):
+        """Devuelve el hash guardado si el archivo no cambió de tamaño ni fecha.
+
+        Si no hay entrada bajo la clave relativa se prueba la ruta absoluta de
+        versiones anteriores y, con identity_fallback, la identidad del archivo;
+        un acierto por esas vías se vuelve a guardar bajo la clave actual.
+        """
+        raiz, relativa = self._clave(ruta)
+        with self._lock:
+            fila = self._leer(raiz, relativa, algoritmo)
+            if fila and fila[0] == mtime and fila[1] == tamano:
+                return fila[3]
+            hash_value = None
+            if raiz:
+                fila = self._leer("", str(ruta), algoritmo)
+                if fila and fila[0] == mtime and fila[1] == tamano:
+                    hash_value = fila[3]
+                    self._pending.pop(("", str(ruta), algoritmo), None)
+                    conn = self._connect()
+                    with conn:
+                        conn.execute(
+                            "DELETE FROM hashes WHERE raiz = '' AND ruta = ? AND algoritmo = ?",
+                            (str(ruta), algoritmo),
+                        )
+            if hash_value is None and self.identity_fallback and inode and raiz:
+                fila = self._connect().execute(
+                    "SELECT hash FROM hashes"
+                    " WHERE raiz = ? AND tamano = ? AND mtime = ? AND inode = ? AND algoritmo = ? LIMIT 1",
+                    (raiz, tamano, mtime, inode, algoritmo),
+                ).fetchone()
+                if fila:
+                    hash_value = fila[0]
+            if hash_value is not None:
+                self.put(ruta, mtime, tamano, hash_value, algoritmo, inode)
+            return hash_value
+
+    def put(self, ruta, mtime, tamano, hash_value, algoritmo=DEFAULT_HASH_ALGORITHM, inode=None):
+        """Registra un hash; se escribe en disco al completar el lote."""
+        raiz, relativa = self._clave(ruta)
+        with self._lock:
+            self._pending[(raiz, relativa, algoritmo)] = (mtime, tamano, inode, hash_value)
+            vencido = time.monotonic() - self._last_flush >= self.flush_seconds
+            if len(self._pending) >= self.batch_size or vencido:
+                self.flush()
+
+    def flush(self):
+        """Escribe las entradas pendientes en una sola transacción."""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._pending:
+                return
+            filas = [(*clave, *valores) for clave, valores in self._pending.items()]
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO hashes (raiz, ruta, algoritmo, mtime, tamano, inode, hash)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        filas,
+                    )
+                self._pending.clear()
+            except sqlite3.Error:
+                pass  # Se reintentará en el siguiente lote
+
+    def purge_missing(self, base_path, existentes=None):
+        """Elimina entradas bajo base_path cuyos archivos ya no existen.
+
+        Si se entrega el conjunto de rutas vistas en el recorrido se evita un
+        stat por entrada. Revisa tanto las claves relativas de la raíz como las
+        absolutas heredadas. Devuelve la cantidad de entradas eliminadas.
+        """
+        base = os.path.abspath(base_path)
+        raiz = self.register_root(base)
+        prefijo = os.path.join(base, "")
+        with self._lock:
+            self.flush()
+            conn = self._connect()
+            claves = [
+                (raiz, fila[0], os.path.join(base, *fila[0].split("/")))
+                for fila in conn.execute("SELECT DISTINCT ruta FROM hashes WHERE raiz = ?", (raiz,))
+            ]
+            claves += [
+                ("", fila[0], fila[0])
+                for fila in conn.execute(
+                    "SELECT DISTINCT ruta FROM hashes WHERE raiz = '' AND ruta >= ? AND ruta < ?",
+                    (prefijo, prefijo + "\uffff"),
+                )
+            ]
+            if existentes is not None:
+                existentes = {os.path.abspath(ruta) for ruta in existentes}
+                obsoletas = [(r, ruta) for r, ruta, absoluta in claves if absoluta not in existentes]
+            else:
+                obsoletas = [(r, ruta) for r, ruta, absoluta in claves if not os.path.exists(absoluta)]
+            if obsoletas:
+                with conn:
+                    conn.executemany("DELETE FROM hashes WHERE raiz = ? AND ruta = ?", obsoletas)
+        return len(obsoletas)
+
+    def load_snapshot(self, base):
+        """Devuelve la última instantánea del árbol guardada para la carpeta base."""
+        base = os.path.abspath(base)
+        raiz = self.register_root(base)
+        with self._lock:
+            filas = self._connect().execute(
+                "SELECT directorio, mtime, subdirectorios, archivos FROM instantaneas WHERE raiz = ?",
+                (raiz,),
+            ).fetchall()
+        return TreeSnapshot({
+            os.path.join(base, *directorio.split("/")) if directorio else base: (
+                mtime,
+                json.loads(subdirectorios),
+                [tuple(a) for a in json.loads(archivos)],
+            )
+            for directorio, mtime, subdirectorios, archivos in filas
+        })
+
+    def save_snapshot(self, base, snapshot):
+        """Reemplaza la instantánea guardada para base en una sola transacción."""
+        base = os.path.abspath(base)
+        raiz = self.register_root(base)
+        filas = []
+        for directorio, (mtime, subdirectorios, archivos) in snapshot.directorios.items():
+            relativo = os.path.relpath(directorio, base)
+            relativo = "" if relativo == os.curdir else relativo.replace(os.sep, "/")
+            filas.append((raiz, relativo, mtime, json.dumps(subdirectorios), json.dumps(archivos)))
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM instantaneas WHERE raiz = ?", (raiz,))
+                conn.executemany(
+                    "INSERT INTO instantaneas (raiz, directorio, mtime, subdirectorios, archivos) VALUES (?, ?, ?, ?, ?)",
+                    filas,
+                )
+
+    def export_bundle(self, base, destino):
+        """Exporta las entradas de la raíz base a un paquete JSON Lines comprimido.
+
+        El paquete solo lleva claves relativas (sin inodos, que dependen del
+        equipo), así que puede importarse en otra copia del mismo árbol.
+        Devuelve la cantidad de entradas exportadas.
+        """
+        raiz = self.register_root(base)
+        with self._lock:
+            self.flush()
+            filas = self._connect().execute(
+                "SELECT ruta, algoritmo, mtime, tamano, hash FROM hashes WHERE raiz = ?",
+                (raiz,),
+            ).fetchall()
+        with gzip.open(destino, "wt", encoding="utf-8") as fh:
+            fh.write(json.dumps({"formato": CACHE_BUNDLE_FORMAT, "version": 1, "raiz": raiz}) + "\n")
+            for ruta, algoritmo, mtime, tamano, hash_value in filas:
+                fh.write(json.dumps([ruta, algoritmo, mtime, tamano, hash_value]) + "\n")
+        return len(filas)
+
+    def import_bundle(self, base, origen):
+        """Fusiona un paquete exportado con export_bundle en la raíz base.
+
+        Las entradas se asignan a la raíz de base aunque el paquete venga de
+        otra, así sirve también para copias sin el mismo marcador. Ante una
+        misma ruta se conserva la versión con mtime más reciente. Devuelve la
+        cantidad de entradas leídas del paquete.
+        """
+        raiz = self.register_root(base)
+        with gzip.open(origen, "rt", encoding="utf-8") as fh:
+            try:
+                cabecera = json.loads(fh.readline())
+            except json.JSONDecodeError:
+                cabecera = None
+            if not isinstance(cabecera, dict) or cabecera.get("formato") != CACHE_BUNDLE_FORMAT:
+                raise ValueError("El archivo no es un paquete de caché de hashes.")
+            filas = [(raiz, *json.loads(linea)) for linea in fh if linea.strip()]
+        with self._lock:
+            self.flush()
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO hashes (raiz, ruta, algoritmo, mtime, tamano, inode, hash)"
+                    " VALUES (?, ?, ?, ?, ?, NULL, ?)"
+                    " ON CONFLICT (raiz, ruta, algoritmo) DO UPDATE SET"
+                    " mtime = excluded.mtime, tamano = excluded.tamano, hash = excluded.hash"
+                    " WHERE excluded.mtime > hashes.mtime",
+                    filas,
+                )
+        return len(filas)
+
+    def save_month(self, base, nombre, filas):
+        """Reemplaza las fotos de base en el historial global.
+
+        filas son tuplas (ruta relativa, algoritmo, tamaño, hash).
+        """
+        raiz = self.register_root(base)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM historial WHERE raiz = ?", (raiz,))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO historial (raiz, ruta, algoritmo, tamano, hash) VALUES (?, ?, ?, ?, ?)",
+                    [(raiz, *fila) for fila in filas],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO meses (raiz, nombre, carpeta, registrado) VALUES (?, ?, ?, ?)",
+                    (raiz, nombre, os.path.abspath(base), time.time()),
+                )
+
+    def list_months(self):
+        """Devuelve [(nombre, carpeta, fotos)] de los meses del historial."""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT m.nombre, m.carpeta, COUNT(DISTINCT h.ruta) FROM meses m"
+                " LEFT JOIN historial h ON h.raiz = m.raiz GROUP BY m.raiz ORDER BY m.nombre"
+            ).fetchall()
+
+    def history_sizes(self, algoritmo, excluir_raiz):
+        """Tamaños de las fotos del historial de otros meses, para descartar sin leer."""
+        with self._lock:
+            return {
+                fila[0] for fila in self._connect().execute(
+                    "SELECT DISTINCT tamano FROM historial WHERE algoritmo = ? AND raiz != ?",
+                    (algoritmo, excluir_raiz),
+                )
+            }
+
+    def history_matches(self, algoritmo, hash_value, excluir_raiz):
+        """Devuelve [(mes, ruta relativa)] de otros meses con el mismo hash."""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT m.nombre, h.ruta FROM historial h JOIN meses m ON m.raiz = h.raiz"
+                " WHERE h.algoritmo = ? AND h.hash = ? AND h.raiz != ? ORDER BY m.nombre, h.ruta",
+                (algoritmo, hash_value, excluir_raiz),
+            ).fetchall()
+
+    def history_fingerprints(self, metodo, excluir_raiz):
+        """Devuelve [(huella entera, mes, ruta relativa)] de otros meses."""
+        with self._lock:
+            filas = self._connect().execute(
+                "SELECT h.hash, m.nombre, h.ruta FROM historial h JOIN meses m ON m.raiz = h.raiz"
+                " WHERE h.algoritmo = ? AND h.raiz != ?",
+                (metodo, excluir_raiz),
+            ).fetchall()
+        return [(int(hash_value, 16), mes, ruta) for hash_value, mes, ruta in filas]
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Imagen encontrada en el recorrido, con los datos de stat leídos una sola vez
+# (mtime es None si la carpeta se reutilizó de una instantánea y no se leyó)
+FileEntry = namedtuple("FileEntry", ["ruta", "tamano", "mtime", "inode"])
+
+
+class ScanCancelled(Exception):
+    """Se lanza en un hilo de trabajo cuando el usuario cancela el análisis."""
+
+
+class TreeSnapshot:
+    """Instantánea de un árbol de carpetas.
+
+    Guarda, por directorio, su mtime, sus subdirectorios y sus imágenes con
+    tamaño, mtime e inodo:
+    {directorio: (mtime, [subdirectorios], [(nombre, tamano, mtime, inode)])}.
+    reutilizados son los directorios copiados de una instantánea anterior sin
+    listarlos: sus datos de archivo pueden estar desactualizados.
+    """
+
+    def __init__(self, directorios=None, reutilizados=None):
+        self.directorios = directorios or {}
+        self.reutilizados = reutilizados or set()
+
+    def archivos(self):
+        """Entrega un FileEntry por cada imagen del árbol.
+
+        En los directorios reutilizados el mtime sale como None: una foto
+        editada en sitio no cambia el mtime de su carpeta, así que quien
+        consulte el caché de hashes debe leer el stat real del archivo.
+        """
+        for directorio, (_, _, archivos) in self.directorios.items():
+            reutilizado = directorio in self.reutilizados
+            for nombre, tamano, mtime, inode in archivos:
+                yield FileEntry(os.path.join(directorio, nombre), tamano, None if reutilizado else mtime, inode)
+
+
+def escanear_arbol(base, previo=None, excluir=SCAN_EXCLUDED_DIRS):
+    """Recorre base y devuelve (TreeSnapshot, carpetas reutilizadas, carpetas releídas).
+
+    Usa os.scandir: el tipo de cada entrada viene del listado y el tamaño, mtime
+    e inodo se toman del DirEntry una única vez, para no repetir stats aguas
+    abajo. Las carpetas de excluir no se recorren. Con una instantánea
+    previa, los directorios cuyo mtime no cambió no se listan ni se hace stat
+    de sus imágenes: se reutiliza lo registrado y solo cuesta un stat por
+    carpeta. Un directorio solo cambia de mtime cuando se agregan, eliminan o
+    renombran entradas, no cuando se edita una foto en sitio, por eso esas
+    imágenes salen de TreeSnapshot.archivos sin mtime y el caché de hashes
+    hace el stat real solo de las que llega a consultar.
+    """
+    anteriores = previo.directorios if previo else {}
+    actuales = {}
+    reutilizados = set()
+    releidas = 0
+    pendientes = [str(Path(base))]
+    while pendientes:
+        directorio = pendientes.pop()
+        try:
+            mtime = os.stat(directorio).st_mtime
+        except OSError:
+            continue
+        anterior = anteriores.get(directorio)
+        if anterior is not None and anterior[0] == mtime:
+            _, subdirectorios, archivos = anterior
+            reutilizados.add(directorio)
+        else:
+            subdirectorios, archivos = [], []
+            try:
+                with os.scandir(directorio) as entradas:
+                    for entrada in entradas:
+                        try:
+                            if entrada.is_dir(follow_symlinks=False):
+                                if entrada.name not in excluir:
+                                    subdirectorios.append(entrada.name)
+                            elif entrada.name.lower().endswith(IMAGE_EXTENSIONS):
+                                file_stat = entrada.stat()
+                                archivos.append((
+                                    entrada.name,
+                                    file_stat.st_size,
+                                    file_stat.st_mtime,
+                                    file_stat.st_ino or None,  # 0 cuando el sistema no lo informa
+                                ))
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+            releidas += 1
+        actuales[directorio] = (mtime, subdirectorios, archivos)
+        pendientes.extend(os.path.join(directorio, nombre) for nombre in subdirectorios)
+    return TreeSnapshot(actuales, reutilizados), len(reutilizados), releidas
+
+
+def listar_subdirectorios(ruta):
+    """Devuelve los nombres de los subdirectorios de ruta con un solo listado."""
+    try:
+        with os.scandir(ruta) as entradas:
+            return {entrada.name for entrada in entradas if entrada.is_dir()}
+    except OSError:
+        return set()
+
+
+def normalizar_seccion(nombre):
+    """Quita sufijos romanos como "(II)" para asociar la carpeta a su sección."""
+    return re.sub(r'\s*\(?(I{1,3}|IV|V{1,3})\)?$', '', nombre).strip()
+
+
+def listar_fotos_estacion(carpeta):
+    """Devuelve {sección: [rutas ordenadas]} con las fotos de una estación.
+
+    Usa os.scandir: el tipo de cada entrada sale del propio listado, sin un
+    stat adicional por carpeta o archivo.
+    """
+    fotos = {}
+    try:
+        with os.scandir(carpeta) as subdirectorios:
+            secciones = [
+                (normalizar_seccion(entrada.name), entrada.path)
+                for entrada in subdirectorios
+                if entrada.is_dir()
+            ]
+    except OSError:
+        return fotos
+    for seccion, ruta in secciones:
+        if seccion not in SUBCARPETAS:
+            continue
+        try:
+            with os.scandir(ruta) as entradas:
+                rutas = [
+                    entrada.path
+                    for entrada in entradas
+                    if entrada.name.lower().endswith(IMAGE_EXTENSIONS) and entrada.is_file()
+                ]
+        except OSError:
+            continue
+        if rutas:
+            fotos.setdefault(seccion, []).extend(sorted(rutas))
+    return fotos
+
+
+class FileHasher:
+    """Calcula digests de archivos con algoritmo y estrategia de lectura configurables.
+
+    Estrategias:
+      - "buffered": lecturas f.read(bloque) sucesivas.
+      - "mmap": mapea el archivo en memoria y lo entrega completo al digest.
+      - "readinto": reutiliza un único búfer por hilo de trabajo (sin asignaciones por bloque).
+    """
+
+    def __init__(self, algorithm=DEFAULT_HASH_ALGORITHM, strategy=DEFAULT_HASH_STRATEGY,
+                 block_size=DEFAULT_HASH_BLOCK_SIZE):
+        if algorithm not in HASH_ALGORITHMS:
+            raise ValueError(f"Algoritmo de hash no soportado: {algorithm}")
+        if strategy not in HASH_READ_STRATEGIES:
+            raise ValueError(f"Estrategia de lectura no soportada: {strategy}")
+        self.algorithm = algorithm
+        self.strategy = strategy
+        self.block_size = int(block_size)
+        self._local = threading.local()
+
+    @classmethod
+    def from_preferences(cls, preferences):
+        """Crea el motor desde las preferencias, usando valores por defecto si no son válidos."""
+        try:
+            return cls(
+                preferences.get("hash_algorithm", DEFAULT_HASH_ALGORITHM),
+                preferences.get("hash_strategy", DEFAULT_HASH_STRATEGY),
+                preferences.get("hash_block_size", DEFAULT_HASH_BLOCK_SIZE),
+            )
+        except (TypeError, ValueError):
+            return cls()
+
+    def describe(self):
+        return f"{self.algorithm}/{self.strategy}/{self.block_size // 1024} KB"
+
+    def _buffer(self):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) != self.block_size:
+            buffer = bytearray(self.block_size)
+            self._local.buffer = buffer
+            self._local.view = memoryview(buffer)
+        return buffer, self._local.view
+
+    def hash_file(self, ruta, control=None):
+        """Devuelve el digest hexadecimal del contenido completo. Propaga OSError.
+
+        control, si se indica, se invoca antes de cada bloque; permite pausar o
+        abortar la lectura de un archivo grande a mitad de camino.
+        """
+        control = control or (lambda: None)
+        hasher = HASH_ALGORITHMS[self.algorithm]()
+        with open(ruta, 'rb', buffering=0 if self.strategy == "readinto" else -1) as f:
+            if self.strategy == "mmap":
+                try:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    return hasher.hexdigest()  # Archivo vacío: no se puede mapear
+                with mapped, memoryview(mapped) as vista:
+                    for inicio in range(0, len(vista), self.block_size):
+                        control()
+                        hasher.update(vista[inicio:inicio + self.block_size])
+            elif self.strategy == "readinto":
+                _, view = self._buffer()
+                while True:
+                    control()
+                    leidos = f.readinto(view)
+                    if not leidos:
+                        break
+                    hasher.update(view[:leidos])
+            else:
+                while True:
+                    control()
+                    datos = f.read(self.block_size)
+                    if not datos:
+                        break
+                    hasher.update(datos)
+        return hasher.hexdigest()
+
+    def hash_partial(self, ruta, tamano, bloque=PARTIAL_HASH_BLOCK):
+        """Calcula el digest del primer y último bloque de un archivo."""
+        hasher = HASH_ALGORITHMS[self.algorithm]()
+        try:
+            with open(ruta, 'rb') as f:
+                hasher.update(f.read(bloque))
+                if tamano > bloque:
+                    f.seek(max(bloque, tamano - bloque))
+                    hasher.update(f.read(bloque))
+        except (IOError, OSError):
+            return None
+        return hasher.hexdigest()
+
+
+def benchmark_hash_engines(rutas, algorithms=None, strategies=None,
+                           block_sizes=(65536, 262144, 1048576), repeticiones=2):
+    """Mide el rendimiento de cada combinación algoritmo/estrategia/bloque.
+
+    Las muestras se leen una vez antes de medir para que todas las combinaciones
+    trabajen con la caché de páginas del sistema caliente; así se compara el costo
+    de CPU y de llamadas al sistema, que es lo que cambia entre combinaciones.
+    Devuelve una lista de (MB/s, algoritmo, estrategia, bloque), de mayor a menor.
+    """
+    rutas = [ruta for ruta in rutas if os.path.isfile(ruta)]
+    total_bytes = sum(os.path.getsize(ruta) for ruta in rutas)
+    if not rutas or total_bytes == 0:
+        return []
+    calentamiento = FileHasher()
+    for ruta in rutas:
+        calentamiento.hash_file(ruta)
+
+    resultados = []
+    for algorithm in algorithms or HASH_ALGORITHMS:
+        for strategy in strategies or HASH_READ_STRATEGIES:
+            # mmap lee el archivo completo de una vez: el bloque no influye
+            bloques = block_sizes[:1] if strategy == "mmap" else block_sizes
+            for block_size in bloques:
+                hasher = FileHasher(algorithm, strategy, block_size)
+                mejor = None
+                for _ in range(repeticiones):
+                    inicio = time.perf_counter()
+                    for ruta in rutas:
+                        hasher.hash_file(ruta)
+                    duracion = time.perf_counter() - inicio
+                    mejor = duracion if mejor is None else min(mejor, duracion)
+                velocidad = total_bytes / (1024 * 1024) / max(mejor, 1e-9)
+                resultados.append((velocidad, algorithm, strategy, block_size))
+    resultados.sort(reverse=True)
+    return resultados
+
+
+def _dct_matrix(n):
+    """Matriz de la DCT-II ortonormal de tamaño n."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matriz = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matriz[0] /= np.sqrt(2)
+    return matriz
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def calcular_hash_perceptual(ruta, metodo=DEFAULT_PERCEPTUAL_METHOD):
+    """Calcula una huella perceptual de 64 bits (dHash o pHash) de una imagen.
+
+    Usa el modo draft de JPEG para decodificar a baja resolución, de modo que no
+    se decodifica la foto completa para obtener 8x8 o 32x32 píxeles.
+    """
+    lado = 32 if metodo == "phash" else 9
+    with Image.open(ruta) as img:
+        img.draft("L", (lado * 4, lado * 4))
+        img = ImageOps.exif_transpose(img).convert("L")
+        if metodo == "phash":
+            pixeles = np.asarray(img.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+            coeficientes = (_DCT_32 @ pixeles @ _DCT_32.T)[:8, :8]
+            bits = coeficientes > np.median(coeficientes.ravel()[1:])
+        else:
+            pixeles = np.asarray(img.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+            bits = pixeles[:, 1:] > pixeles[:, :-1]
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+class BKTree:
+    """Árbol BK sobre distancia de Hamming para buscar huellas cercanas.
+
+    Cada búsqueda visita solo las ramas compatibles con la desigualdad
+    triangular, evitando comparar todos los pares de imágenes.
+    """
+
+    def __init__(self):
+        self.root = None  # [huella, [elementos], {distancia: nodo}]
+
+    @staticmethod
+    def distance(a, b):
+        return (a ^ b).bit_count()
+
+    def add(self, huella, elemento):
+        if self.root is None:
+            self.root = [huella, [elemento], {}]
+            return
+        nodo = self.root
+        while True:
+            distancia = self.distance(huella, nodo[0])
+            if distancia == 0:
+                nodo[1].append(elemento)
+                return
+            hijo = nodo[2].get(distancia)
+            if hijo is None:
+                nodo[2][distancia] = [huella, [elemento], {}]
+                return
+            nodo = hijo
+
+    def search(self, huella, radio):
+        """Devuelve los elementos a distancia <= radio de la huella."""
+        encontrados = []
+        pendientes = [self.root] if self.root is not None else []
+        while pendientes:
+            nodo = pendientes.pop()
+            distancia = self.distance(huella, nodo[0])
+            if distancia <= radio:
+                encontrados.extend(nodo[1])
+            for arista, hijo in nodo[2].items():
+                if distancia - radio <= arista <= distancia + radio:
+                    pendientes.append(hijo)
+        return encontrados
+
+
+class FinderBase:
+    """Infraestructura común de los motores de búsqueda: pausa, cancelación y avance."""
+
+    def __init__(self, max_workers=None, cancel_event=None, pause_event=None, on_progress=None, on_group=None):
+        self.max_workers = max_workers or max(2, os.cpu_count() or 2)
+        self.cancel_event = cancel_event or threading.Event()
+        self.pause_event = pause_event or threading.Event()
+        self.on_progress = on_progress      # (procesados, total) -> None
+        self.on_group = on_group            # (clave, rutas_nuevas) -> None, al formarse o crecer un grupo
+        self.total = 0
+        self.procesados = 0
+
+    def _avanzar(self, cantidad=1):
+        self.procesados += cantidad
+        if self.on_progress and cantidad:
+            self.on_progress(self.procesados, self.total)
+
+    def _agregar_a_grupo(self, grupos, clave, ruta):
+        """Agrega ruta al grupo clave y notifica en cuanto el grupo tiene dos o más archivos."""
+        grupo = grupos[clave]
+        grupo.append(ruta)
+        if self.on_group and len(grupo) >= 2:
+            self.on_group(clave, list(grupo) if len(grupo) == 2 else [ruta])
+
+    def _detenido(self):
+        while self.pause_event.is_set() and not self.cancel_event.is_set():
+            time.sleep(0.2)
+        return self.cancel_event.is_set()
+
+    def checkpoint(self):
+        """Punto de control de los hilos de trabajo: espera durante la pausa y aborta al cancelar."""
+        if self._detenido():
+            raise ScanCancelled()
+
+    def _map(self, executor, func, items):
+        """Ejecuta func en paralelo y entrega (item, resultado) según terminan.
+
+        Mantiene a lo sumo max_workers * SCAN_INFLIGHT_PER_WORKER tareas en vuelo,
+        así la memoria no crece con la cantidad de archivos. Durante la pausa no se
+        envían tareas nuevas y los hilos se detienen en su siguiente punto de
+        control; al cancelar se descartan las tareas que siguen en cola.
+        """
+        def tarea(item):
+            self.checkpoint()
+            return func(item)
+
+        pendientes = iter(items)
+        en_vuelo = {}
+        limite = self.max_workers * SCAN_INFLIGHT_PER_WORKER
+        agotados = False
+        try:
+            while True:
+                while not agotados and len(en_vuelo) < limite:
+                    if self._detenido():
+                        return
+                    try:
+                        item = next(pendientes)
+                    except StopIteration:
+                        agotados = True
+                        break
+                    en_vuelo[executor.submit(tarea, item)] = item
+                if not en_vuelo:
+                    return
+                terminados, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for future in terminados:
+                    item = en_vuelo.pop(future)
+                    try:
+                        resultado = future.result()
+                    except ScanCancelled:
+                        return
+                    yield item, resultado
+                if self.cancel_event.is_set():
+                    return
+        finally:
+            for future in en_vuelo:
+                future.cancel()
+
+
+class NearDuplicateFinder(FinderBase):
+    """Agrupa fotos visualmente similares (recompresiones, cambios de tamaño).
+
+    Calcula una huella perceptual por imagen y une en un mismo grupo las que
+    quedan a una distancia de Hamming menor o igual al umbral, usando un
+    árbol BK para las búsquedas de vecinos.
+    """
+
+    def __init__(self, hash_func, threshold=DEFAULT_SIMILARITY_THRESHOLD, **kwargs):
+        super().__init__(**kwargs)
+        self.hash_func = hash_func          # (ruta, control, tamano, mtime, inode) -> huella entera (o None)
+        self.threshold = threshold
+
+    def find(self, candidatos):
+        """Recibe FileEntry y devuelve {huella_hex: [rutas]} con grupos de 2 o más."""
+        candidatos = list(candidatos)
+        self.total = len(candidatos)
+        self.procesados = 0
+        huellas = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for entrada, huella in self._map(executor, self._huella, candidatos):
+                if huella is not None:
+                    huellas[entrada.ruta] = huella
+                self._avanzar()
+        if self.cancel_event.is_set():
+            return {}
+
+        arbol = BKTree()
+        for ruta, huella in huellas.items():
+            arbol.add(huella, ruta)
+
+        # Unión de componentes: la similitud se propaga entre vecinos
+        padre = {ruta: ruta for ruta in huellas}
+
+        def raiz(ruta):
+            while padre[ruta] != ruta:
+                padre[ruta] = padre[padre[ruta]]
+                ruta = padre[ruta]
+            return ruta
+
+        for ruta, huella in huellas.items():
+            for vecina in arbol.search(huella, self.threshold):
+                a, b = raiz(ruta), raiz(vecina)
+                if a != b:
+                    padre[max(a, b)] = min(a, b)
+
+        componentes = defaultdict(list)
+        for ruta in huellas:
+            componentes[raiz(ruta)].append(ruta)
+        grupos = {}
+        for rutas in componentes.values():
+            if len(rutas) > 1:
+                rutas.sort()
+                grupos[f"{huellas[rutas[0]]:016x}"] = rutas
+        grupos = dict(sorted(grupos.items(), key=lambda item: item[1][0]))
+        if self.on_group:
+            # Los componentes pueden fusionarse hasta la última huella: se publican al final
+            for clave, rutas in grupos.items():
+                self.on_group(clave, list(rutas))
+        return grupos
+
+    def _huella(self, entrada):
+        return self.hash_func(
+            entrada.ruta, control=self.checkpoint, tamano=entrada.tamano, mtime=entrada.mtime, inode=entrada.inode
+        )
+
+
+class DuplicateFinder(FinderBase):
+    """Motor escalonado de búsqueda de duplicados exactos.
+
+    1. Agrupa los candidatos por tamaño y descarta los tamaños únicos sin leerlos.
+    2. Calcula un hash parcial (primer y último bloque) de los que comparten tamaño.
+    3. Solo los que además coinciden en el hash parcial reciben el hash completo.
+
+    El resultado es el mismo que hashear todo, leyendo una fracción de los bytes.
+    """
+
+    def __init__(self, hash_func, lookup_func=None, partial_func=None,
+                 partial_block=PARTIAL_HASH_BLOCK, **kwargs):
+        super().__init__(**kwargs)
+        self.hash_func = hash_func          # (ruta, control, tamano, mtime, inode) -> hash completo (o None)
+        self.lookup_func = lookup_func      # FileEntry -> hash en caché (o None)
+        self.partial_func = partial_func or FileHasher().hash_partial  # (ruta, tamano, bloque) -> hash
+        self.partial_block = partial_block
+        self.bytes_totales = 0
+        self.bytes_leidos = 0
+
+    def find(self, candidatos):
+        """Recibe FileEntry y devuelve {hash: [rutas]} con grupos de 2 o más."""
+        candidatos = list(candidatos)
+        self.total = len(candidatos)
+        self.procesados = 0
+        self.bytes_totales = sum(entrada.tamano for entrada in candidatos)
+        self.bytes_leidos = 0
+
+        por_tamano = defaultdict(list)
+        for entrada in candidatos:
+            por_tamano[entrada.tamano].append(entrada)
+
+        hashes = defaultdict(list)
+        para_parcial = []
+        para_completo = []
+        descartados = 0
+        for tamano, grupo in por_tamano.items():
+            if len(grupo) < 2:
+                descartados += 1
+                continue
+            sin_cache = []
+            for entrada in grupo:
+                conocido = self.lookup_func(entrada) if self.lookup_func else None
+                if conocido:
+                    self._agregar_a_grupo(hashes, conocido, entrada.ruta)
+                    descartados += 1
+                else:
+                    sin_cache.append(entrada)
+            if not sin_cache:
+                continue
+            # Si el bloque parcial cubre todo el archivo, o hay que compararlos con
+            # hashes completos ya conocidos, el hash parcial no ahorra lecturas.
+            if len(sin_cache) < len(grupo) or tamano <= 2 * self.partial_block:
+                para_completo.extend(sin_cache)
+            else:
+                para_parcial.extend(sin_cache)
+        self._avanzar(descartados)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            por_parcial = defaultdict(list)
+            for entrada, parcial in self._map(
+                executor, lambda e: self.partial_func(e.ruta, e.tamano, self.partial_block), para_parcial
+            ):
+                self.bytes_leidos += min(entrada.tamano, 2 * self.partial_block)
+                if parcial:
+                    por_parcial[(entrada.tamano, parcial)].append(entrada)
+                else:
+                    self._avanzar()
+            if self.cancel_event.is_set():
+                return {}
+
+            for grupo in por_parcial.values():
+                if len(grupo) > 1:
+                    para_completo.extend(grupo)
+                else:
+                    self._avanzar()
+
+            for entrada, file_hash in self._map(
+                executor,
+                lambda e: self.hash_func(
+                    e.ruta, control=self.checkpoint, tamano=e.tamano, mtime=e.mtime, inode=e.inode
+                ),
+                para_completo,
+            ):
+                self.bytes_leidos += entrada.tamano
+                if file_hash:
+                    self._agregar_a_grupo(hashes, file_hash, entrada.ruta)
+                self._avanzar()
+            if self.cancel_event.is_set():
+                return {}
+
+        grupos = {h: sorted(rutas) for h, rutas in hashes.items() if len(rutas) > 1}
+        return dict(sorted(grupos.items(), key=lambda item: item[1][0]))
+
+
+def nombre_mes(base):
+    """Nombre con que se muestra un mes en el historial, p. ej. "2025/10 Octubre"."""
+    partes = Path(os.path.abspath(base)).parts
+    return "/".join(partes[-2:]) if len(partes) > 2 else partes[-1]
+
+
+class HistoryIndex(FinderBase):
+    """Índice global de fotos de meses anteriores.
+
+    register() guarda el hash de contenido (y, si se pide, la huella
+    perceptual) de todas las fotos de una carpeta de mes. find() busca las
+    fotos del mes actual en los demás meses registrados sin volver a
+    recorrerlos: en modo exacto solo se hashean las fotos cuyo tamaño existe
+    en el historial; en modo similares las huellas del historial se cargan
+    en un árbol BK.
+    """
+
+    def __init__(self, store, hashing, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.hashing = hashing
+
+    def _hashear(self, executor, func, entradas):
+        for entrada, valor in self._map(
+            executor,
+            lambda e: func(e.ruta, control=self.checkpoint, tamano=e.tamano, mtime=e.mtime, inode=e.inode),
+            entradas,
+        ):
+            self._avanzar()
+            if valor is not None:
+                yield entrada, valor
+
+    def register(self, base, nombre=None, perceptual=False):
+        """Registra (o actualiza) la carpeta de mes base; devuelve las fotos indexadas."""
+        base = os.path.abspath(base)
+        snapshot, _, _ = escanear_arbol(base)
+        entradas = list(snapshot.archivos())
+        self.total = len(entradas) * (2 if perceptual else 1)
+        self.procesados = 0
+        filas = []
+
+        def relativa(ruta):
+            return os.path.relpath(ruta, base).replace(os.sep, "/")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            algoritmo = self.hashing.hasher.algorithm
+            for entrada, hash_value in self._hashear(executor, self.hashing.content_hash, entradas):
+                filas.append((relativa(entrada.ruta), algoritmo, entrada.tamano, hash_value))
+            if perceptual and not self.cancel_event.is_set():
+                metodo = self.hashing.perceptual_method
+                for entrada, huella in self._hashear(executor, self.hashing.perceptual_hash, entradas):
+                    filas.append((relativa(entrada.ruta), metodo, entrada.tamano, f"{huella:016x}"))
+        if self.cancel_event.is_set():
+            return 0
+        self.store.save_month(base, nombre or nombre_mes(base), filas)
+        return len(entradas)
+
+    def find(self, candidatos, base, similares=False, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        """Devuelve {ruta: [(mes, ruta relativa en ese mes)]} de las fotos ya vistas en otros meses."""
+        raiz = self.store.register_root(base)
+        coincidencias = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            if similares:
+                arbol = BKTree()
+                for huella, mes, ruta in self.store.history_fingerprints(self.hashing.perceptual_method, raiz):
+                    arbol.add(huella, (mes, ruta))
+                entradas = list(candidatos) if arbol.root is not None else []
+                self.total, self.procesados = len(entradas), 0
+                for entrada, huella in self._hashear(executor, self.hashing.perceptual_hash, entradas):
+                    encontrados = arbol.search(huella, threshold)
+                    if encontrados:
+                        coincidencias[entrada.ruta] = sorted(encontrados)
+            else:
+                algoritmo = self.hashing.hasher.algorithm
+                tamanos = self.store.history_sizes(algoritmo, raiz)
+                entradas = [entrada for entrada in candidatos if entrada.tamano in tamanos]
+                self.total, self.procesados = len(entradas), 0
+                for entrada, hash_value in self._hashear(executor, self.hashing.content_hash, entradas):
+                    encontrados = self.store.history_matches(algoritmo, hash_value, raiz)
+                    if encontrados:
+                        coincidencias[entrada.ruta] = encontrados
+        if self.cancel_event.is_set():
+            return {}
+        return dict(sorted(coincidencias.items()))
+
+
+class CachedHashing:
+    """Funciones de hash del análisis con el caché persistente delante.
+
+    Reúne el motor de hash, el método perceptual y el caché para que la
+    interfaz y la línea de comandos usen el mismo motor de búsqueda.
+    """
+
+    def __init__(self, store, hasher=None, perceptual_method=DEFAULT_PERCEPTUAL_METHOD):
+        self.store = store
+        self.hasher = hasher or FileHasher()
+        self.perceptual_method = perceptual_method if perceptual_method in PERCEPTUAL_METHODS else DEFAULT_PERCEPTUAL_METHOD
+
+    @staticmethod
+    def stat(ruta_archivo, tamano=None, mtime=None):
+        """Devuelve (tamaño, mtime), usando los del recorrido si se entregan."""
+        if tamano is not None and mtime is not None:
+            return tamano, mtime
+        try:
+            file_stat = os.stat(ruta_archivo)
+        except OSError:
+            return None
+        return file_stat.st_size, file_stat.st_mtime
+
+    def content_hash(self, ruta_archivo, control=None, tamano=None, mtime=None, inode=None):
+        """Calcula el hash de un archivo para comparación con el motor configurado."""
+        datos_stat = self.stat(ruta_archivo, tamano, mtime)
+        if datos_stat is None:
+            return None
+        tamano, mtime = datos_stat
+        algoritmo = self.hasher.algorithm
+        cached = self.store.get(ruta_archivo, mtime, tamano, algoritmo, inode)
+        if cached:
+            return cached
+        try:
+            hash_value = self.hasher.hash_file(ruta_archivo, control)
+            self.store.put(ruta_archivo, mtime, tamano, hash_value, algoritmo, inode)
+            return hash_value
+        except (IOError, OSError):
+            return None
+
+    def cached_content_hash(self, ruta_archivo):
+        """Devuelve el hash de contenido solo si ya está en el caché (nunca lee el archivo)."""
+        datos_stat = self.stat(ruta_archivo)
+        if datos_stat is None:
+            return None
+        tamano, mtime = datos_stat
+        return self.store.get(ruta_archivo, mtime, tamano, self.hasher.algorithm)
+
+    def perceptual_hash(self, ruta_archivo, control=None, tamano=None, mtime=None, inode=None):
+        """Calcula la huella perceptual de una imagen, guardándola junto al hash de contenido."""
+        datos_stat = self.stat(ruta_archivo, tamano, mtime)
+        if datos_stat is None:
+            return None
+        tamano, mtime = datos_stat
+        metodo = self.perceptual_method
+        cached = self.store.get(ruta_archivo, mtime, tamano, metodo, inode)
+        if cached:
+            return int(cached, 16)
+        if control:
+            control()
+        try:
+            huella = calcular_hash_perceptual(ruta_archivo, metodo)
+        except Exception:
+            return None  # Imagen corrupta o formato no decodificable
+        self.store.put(ruta_archivo, mtime, tamano, f"{huella:016x}", metodo, inode)
+        return huella
+
+    def lookup(self, entrada):
+        """Devuelve el hash de contenido en caché de un FileEntry, sin leer el archivo.
+
+        Si la entrada no trae mtime (carpeta reutilizada de una instantánea) se
+        consulta con el stat real, para no servir el hash de una versión anterior.
+        """
+        datos_stat = self.stat(entrada.ruta, entrada.tamano, entrada.mtime)
+        if datos_stat is None:
+            return None
+        tamano, mtime = datos_stat
+        return self.store.get(entrada.ruta, mtime, tamano, self.hasher.algorithm, entrada.inode)
+
+    def make_finder(self, similares=False, threshold=DEFAULT_SIMILARITY_THRESHOLD, **kwargs):
+        """Crea el motor de búsqueda (exactos o similares) conectado al caché."""
+        if similares:
+            return NearDuplicateFinder(hash_func=self.perceptual_hash, threshold=threshold, **kwargs)
+        return DuplicateFinder(
+            hash_func=self.content_hash,
+            lookup_func=self.lookup,
+            partial_func=self.hasher.hash_partial,
+            **kwargs,
+        )
+
+
+def clonar_archivo(origen, destino):
+    """Crea destino como reflink de origen: una copia que comparte los bloques en disco.
+
+    Usa FICLONE en Linux (Btrfs, XFS) y clonefile en macOS (APFS). Lanza
+    OSError si el sistema de archivos no lo admite.
+    """
+    if fcntl is not None and sys.platform.startswith("linux"):
+        with open(origen, "rb") as src:
+            fd = os.open(destino, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            try:
+                fcntl.ioctl(fd, FICLONE, src.fileno())
+            except OSError:
+                os.close(fd)
+                os.remove(destino)
+                raise
+            os.close(fd)
+        return
+    if sys.platform == "darwin":
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(origen), os.fsencode(destino), 0) != 0:
+            codigo = ctypes.get_errno()
+            raise OSError(codigo, os.strerror(codigo), destino)
+        return
+    raise OSError(errno.ENOTSUP, "Reflink no disponible en este sistema", destino)
+
+
+def _ruta_temporal(ruta):
+    """Nombre temporal junto a ruta, en la misma carpeta para que os.replace sea atómico."""
+    carpeta, nombre = os.path.split(ruta)
+    return os.path.join(carpeta, f".{nombre}.{uuid.uuid4().hex[:8]}.tmp")
+
+
+class DuplicateReclaimer:
+    """Reemplaza copias idénticas por enlaces a una copia canónica.
+
+    Cada copia se compara byte a byte con la canónica, el enlace (reflink o
+    enlace duro) se crea con un nombre temporal en la misma carpeta y se
+    sustituye con os.replace, así la ruta nunca queda vacía ni a medio
+    escribir. Cada reemplazo se anota en un diario JSON Lines que
+    revertir_enlaces usa para deshacerlo; la anotación se escribe antes del
+    reemplazo, así un corte a mitad de camino nunca deja un enlace sin
+    registrar (revertir una anotación cuyo reemplazo no llegó a hacerse solo
+    reescribe la misma copia).
+    """
+
+    def __init__(self, journal_path, method=DEFAULT_RECLAIM_METHOD, cancel_event=None):
+        self.journal_path = Path(journal_path)
+        self.method = method if method in RECLAIM_METHODS else DEFAULT_RECLAIM_METHOD
+        self.cancel_event = cancel_event or threading.Event()
+        self.enlazados = 0
+        self.bytes_recuperados = 0
+        self._journal = None
+
+    def _registrar(self, registro):
+        if self._journal is None:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            self._journal = self.journal_path.open("a", encoding="utf-8")
+        self._journal.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _enlazar(self, canonica, temporal):
+        """Crea temporal apuntando al contenido de canonica y devuelve el método usado."""
+        if self.method in ("auto", "reflink"):
+            try:
+                clonar_archivo(canonica, temporal)
+                return "reflink"
+            except OSError:
+                if self.method == "reflink":
+                    raise
+        os.link(canonica, temporal)
+        return "hardlink"
+
+    def reclaim_file(self, canonica, ruta):
+        """Reemplaza ruta por un enlace a canonica.
+
+        Devuelve el método usado, o None si ya eran el mismo archivo. Lanza
+        ValueError si el contenido difiere y OSError si el reemplazo falla.
+        """
+        if os.path.samefile(canonica, ruta):
+            return None
+        if not filecmp.cmp(canonica, ruta, shallow=False):
+            raise ValueError("el contenido no coincide con la copia canónica")
+        estado = os.stat(ruta)
+        temporal = _ruta_temporal(ruta)
+        metodo = self._enlazar(canonica, temporal)
+        try:
+            if metodo == "reflink":
+                # Un reflink es un archivo propio: conserva permisos y fechas de la copia
+                os.chmod(temporal, stat.S_IMODE(estado.st_mode))
+                os.utime(temporal, ns=(estado.st_atime_ns, estado.st_mtime_ns))
+            self._registrar({
+                "ruta": ruta,
+                "canonica": canonica,
+                "metodo": metodo,
+                "modo": stat.S_IMODE(estado.st_mode),
+                "atime_ns": estado.st_atime_ns,
+                "mtime_ns": estado.st_mtime_ns,
+            })
+            os.replace(temporal, ruta)
+        except OSError:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        self.enlazados += 1
+        self.bytes_recuperados += estado.st_size
+        return metodo
+
+    def reclaim_group(self, rutas):
+        """Enlaza rutas[1:] a rutas[0] y entrega (ruta, método, error) por cada copia."""
+        canonica = rutas[0]
+        for ruta in rutas[1:]:
+            if self.cancel_event.is_set():
+                return
+            try:
+                yield ruta, self.reclaim_file(canonica, ruta), None
+            except (OSError, ValueError) as exc:
+                yield ruta, None, str(exc)
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+def revertir_enlaces(journal_path):
+    """Deshace los reemplazos anotados en un diario de DuplicateReclaimer.
+
+    Como el contenido era idéntico, basta volver a escribir cada ruta como un
+    archivo independiente con los permisos y fechas que tenía. Si todo se
+    restauró, el diario se renombra con la extensión .revertido. Devuelve
+    (restaurados, [errores]).
+    """
+    journal_path = Path(journal_path)
+    with journal_path.open("r", encoding="utf-8") as fh:
+        registros = [json.loads(linea) for linea in fh if linea.strip()]
+    restaurados = 0
+    errores = []
+    for registro in reversed(registros):
+        ruta = registro["ruta"]
+        fuente = ruta if os.path.exists(ruta) else registro["canonica"]
+        temporal = _ruta_temporal(ruta)
+        try:
+            shutil.copyfile(fuente, temporal)
+            os.chmod(temporal, registro["modo"])
+            os.utime(temporal, ns=(registro["atime_ns"], registro["mtime_ns"]))
+            os.replace(temporal, ruta)
+            restaurados += 1
+        except OSError as exc:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            errores.append(f"{ruta}: {exc}")
+    if not errores:
+        journal_path.rename(journal_path.with_name(journal_path.name + ".revertido"))
+    return restaurados, errores
+
+
+def ultimo_diario_enlaces(base):
+    """Devuelve el diario de enlaces más reciente sin revertir de base, o None."""
+    diarios = sorted((Path(base) / REPORTS_DIRNAME).glob(f"{RECLAIM_JOURNAL_PREFIX}*.jsonl"))
+    return diarios[-1] if diarios else None
+
+
+def crear_miniatura(ruta, lado):
+    """Devuelve una miniatura RGB de ruta con lado máximo lado, ya rotada según EXIF.
+
+    El modo draft hace que el decodificador JPEG reduzca la imagen mientras la
+    lee, así no se decodifica la foto de la cámara a resolución completa.
+    """
+    with Image.open(ruta) as img:
+        img.draft("RGB", (lado, lado))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((lado, lado))
+        return img.convert("RGB")
+
+
+class ThumbnailCache:
+    """Caché en disco de miniaturas, direccionado por contenido.
+
+    Cada miniatura se guarda como JPEG en una carpeta repartida por los dos
+    primeros caracteres de la clave, con nombre <clave>_<lado>.jpg. La clave es
+    el hash de contenido cuando ya se conoce (las copias idénticas comparten
+    miniatura); si no, se deriva de ruta, tamaño y mtime, para no leer la foto
+    entera solo para nombrar su miniatura. Un archivo editado recibe una
+    miniatura nueva en ambos casos. Un acierto actualiza el mtime del archivo,
+    que sirve de marca de último uso; al superar max_bytes se borran las menos
+    usadas recientemente.
+    """
+
+    def __init__(self, directory=THUMB_CACHE_DIR, max_bytes=THUMB_CACHE_MAX_BYTES, hash_func=None):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hash_func = hash_func  # ruta -> hash de contenido ya conocido (o None); no debería leer la foto
+        self._lock = threading.Lock()
+        self._total = None  # Bytes en disco; se calcula en la primera escritura
+
+    def _ruta(self, clave, lado):
+        return self.directory / clave[:2] / f"{clave}_{lado}.jpg"
+
+    def path_for(self, ruta, lado, clave=None):
+        """Devuelve la ruta de la miniatura en caché, generándola si falta.
+
+        clave es el hash de contenido si ya se conoce; si no, se pide a
+        hash_func y, a falta de él, se usa la identidad del archivo. Lanza
+        OSError si la imagen no puede leerse.
+        """
+        clave = clave or (self.hash_func(ruta) if self.hash_func else None) or self._clave_archivo(ruta)
+        destino = self._ruta(clave, lado)
+        try:
+            os.utime(destino)
+            return destino
+        except OSError:
+            pass
+        img = crear_miniatura(ruta, lado)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temporal = destino.with_name(f".{destino.name}.{uuid.uuid4().hex[:8]}.tmp")
+        img.save(temporal, "JPEG", quality=85)
+        os.replace(temporal, destino)
+        self._registrar(destino.stat().st_size)
+        return destino
+
+    @staticmethod
+    def _clave_archivo(ruta):
+        """Clave de la miniatura a partir de ruta, tamaño y mtime, con un solo stat."""
+        info = os.stat(ruta)
+        marca = f"{os.path.abspath(ruta)}\0{info.st_size}\0{info.st_mtime_ns}"
+        return hashlib.sha1(marca.encode("utf-8", "surrogateescape")).hexdigest()
+
+    def get(self, ruta, lado, clave=None):
+        """Devuelve la miniatura de ruta como imagen PIL ya cargada."""
+        try:
+            destino = self.path_for(ruta, lado, clave)
+        except OSError:
+            return crear_miniatura(ruta, lado)  # Sin clave no se guarda
+        with Image.open(destino) as img:
+            img.load()
+            return img
+
+    def _registrar(self, tamano):
+        with self._lock:
+            if self._total is None:
+                self._total = sum(f.stat().st_size for f in self.directory.glob("*/*.jpg"))
+            else:
+                self._total += tamano
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Borra las miniaturas menos usadas hasta quedar bajo el 90 % del límite."""
+        archivos = []
+        for archivo in self.directory.glob("*/*.jpg"):
+            try:
+                info = archivo.stat()
+            except OSError:
+                continue
+            archivos.append((info.st_mtime, info.st_size, archivo))
+        archivos.sort()
+        self._total = sum(tamano for _, tamano, _ in archivos)
+        limite = self.max_bytes * 0.9
+        for _, tamano, archivo in archivos:
+            if self._total <= limite:
+                break
+            try:
+                archivo.unlink()
+                self._total -= tamano
+            except OSError:
+                continue
+
+
+def escribir_reporte_duplicados(duplicados, ruta_reporte, ruta_base, similares=False,
+                                grupos_por_pagina=REPORT_GROUPS_PER_PAGE, lado_miniatura=REPORT_THUMB_SIZE,
+                                miniaturas_cache=None, historial=None):
+    """Escribe el reporte HTML de duplicados y devuelve la ruta de su página índice.
+
+    El reporte se escribe directo a disco, página por página, con
+    grupos_por_pagina grupos en cada una. Las imágenes se muestran con
+    miniaturas JPEG que se generan en paralelo en una carpeta junto al
+    índice; cada miniatura enlaza al archivo original. En modo exacto todas
+    las fotos de un grupo son iguales y comparten una sola miniatura. Con un
+    ThumbnailCache las miniaturas se copian del caché en vez de decodificar
+    los originales. historial, {ruta: (info del archivo, [(mes, ruta en ese
+    mes)])}, agrega al índice la tabla de fotos ya vistas en meses anteriores.
+    """
+    ruta_reporte = Path(ruta_reporte)
+    ruta_reporte.parent.mkdir(parents=True, exist_ok=True)
+    destino = ruta_reporte
+    if destino.exists():
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        destino = ruta_reporte.with_name(f"{ruta_reporte.stem}_{timestamp}{ruta_reporte.suffix}")
+    carpeta_miniaturas = destino.with_name(f"{destino.stem}_miniaturas")
+    carpeta_miniaturas.mkdir(exist_ok=True)
+
+    grupos = list(duplicados.items())
+    paginas = [grupos[i:i + grupos_por_pagina] for i in range(0, len(grupos), grupos_por_pagina)]
+    tipo = "similares" if similares else "idénticas"
+    fecha = datetime.now().strftime('%d/%m/%Y %H:%M')
+
+    def nombre_pagina(numero):
+        return f"{destino.stem}_p{numero:03d}.html"
+
+    def cabecera(fh, titulo):
+        fh.write(
+            "<!DOCTYPE html>\n<html lang=\"es\">\n<head>\n<meta charset=\"utf-8\">\n"
+            f"<title>{html.escape(titulo)}</title>\n<style>{REPORT_STYLE}</style>\n</head>\n<body>\n"
+            f"<h1>{html.escape(titulo)}</h1>\n"
+        )
+
+    def navegacion(fh, numero):
+        enlaces = [f'<a href="{html.escape(destino.name)}">Índice</a>']
+        if numero > 1:
+            enlaces.append(f'<a href="{nombre_pagina(numero - 1)}">← Anterior</a>')
+        if numero < len(paginas):
+            enlaces.append(f'<a href="{nombre_pagina(numero + 1)}">Siguiente →</a>')
+        fh.write(f'<p class="nav">{" · ".join(enlaces)}</p>\n')
+
+    def guardar_miniatura(ruta, archivo_miniatura, clave_contenido):
+        try:
+            if miniaturas_cache is not None:
+                shutil.copyfile(miniaturas_cache.path_for(ruta, lado_miniatura, clave_contenido), archivo_miniatura)
+            else:
+                crear_miniatura(ruta, lado_miniatura).save(archivo_miniatura, "JPEG", quality=80)
+        except Exception:
+            pass  # La tarjeta queda con el texto alternativo
+
+    miniaturas = set()
+    with ThreadPoolExecutor() as executor:
+        with destino.open("w", encoding="utf-8") as indice:
+            cabecera(indice, "Reporte de Fotos Duplicadas")
+            indice.write(
+                f"<p>Generado el: {fecha}</p>\n"
+                f"<p>Directorio analizado: {html.escape(str(ruta_base))}</p>\n"
+                f"<p>Se encontraron {len(grupos)} grupos de fotos duplicadas.</p>\n"
+            )
+            if paginas:
+                indice.write("<table>\n<tr><th>Página</th><th>Grupos</th><th>Fotos</th><th>Estaciones</th></tr>\n")
+            primer_grupo = 1
+            for numero, pagina in enumerate(paginas, 1):
+                estaciones = sorted({archivo['estacion'] for _, archivos in pagina for archivo in archivos})
+                if len(estaciones) > 8:
+                    estaciones = estaciones[:8] + [f"y {len(estaciones) - 8} más"]
+                ultimo_grupo = primer_grupo + len(pagina) - 1
+                indice.write(
+                    f'<tr><td><a href="{nombre_pagina(numero)}">Página {numero}</a></td>'
+                    f"<td>{primer_grupo}–{ultimo_grupo}</td>"
+                    f"<td>{sum(len(archivos) for _, archivos in pagina)}</td>"
+                    f"<td>{html.escape(', '.join(estaciones))}</td></tr>\n"
+                )
+
+                with destino.with_name(nombre_pagina(numero)).open("w", encoding="utf-8") as fh:
+                    cabecera(fh, f"Reporte de Fotos Duplicadas · Página {numero} de {len(paginas)}")
+                    navegacion(fh, numero)
+                    for i, (hash_value, archivos) in enumerate(pagina, primer_grupo):
+                        fh.write(
+                            f'<div class="grupo">\n<h2>Grupo {i} - {len(archivos)} fotos {tipo}</h2>\n'
+                            f'<p class="hash">Hash: {html.escape(hash_value)}</p>\n'
+                        )
+                        for archivo in archivos:
+                            if similares:
+                                clave = hashlib.md5(archivo['ruta'].encode("utf-8")).hexdigest()
+                            else:
+                                clave = hash_value
+                            if clave not in miniaturas:
+                                miniaturas.add(clave)
+                                executor.submit(
+                                    guardar_miniatura,
+                                    archivo['ruta'],
+                                    carpeta_miniaturas / f"{clave}.jpg",
+                                    None if similares else hash_value,
+                                )
+                            fh.write(
+                                '<div class="foto">\n'
+                                f'<a href="{html.escape(Path(archivo["ruta"]).as_uri())}">'
+                                f'<img src="{html.escape(carpeta_miniaturas.name)}/{clave}.jpg" loading="lazy"'
+                                f' alt="{html.escape(archivo["nombre_archivo"])}"></a>\n'
+                                f'<p class="estacion">Estación: {html.escape(archivo["estacion"])}</p>\n'
+                                f'<p class="subcarpeta">Subcarpeta: {html.escape(archivo["subcarpeta"])}</p>\n'
+                                f'<p>Archivo: {html.escape(archivo["nombre_archivo"])}</p>\n'
+                                f'<p class="ruta">Ruta: {html.escape(archivo["ruta"])}</p>\n'
+                                "</div>\n"
+                            )
+                        fh.write("</div>\n")
+                    navegacion(fh, numero)
+                    fh.write("</body>\n</html>\n")
+                primer_grupo = ultimo_grupo + 1
+            if paginas:
+                indice.write("</table>\n")
+            if historial:
+                indice.write(
+                    f"<h2>Fotos de meses anteriores ({len(historial)})</h2>\n"
+                    "<table>\n<tr><th>Foto del mes</th><th>Mes</th><th>Ruta en ese mes</th></tr>\n"
+                )
+                for ruta, (info, origenes) in historial.items():
+                    descripcion = f"{info['estacion']} / {info['subcarpeta']} / {info['nombre_archivo']}"
+                    for mes, origen in origenes:
+                        indice.write(
+                            f'<tr><td><a href="{html.escape(Path(ruta).as_uri())}">{html.escape(descripcion)}</a></td>'
+                            f"<td>{html.escape(mes)}</td><td>{html.escape(origen)}</td></tr>\n"
+                        )
+                indice.write("</table>\n")
+            indice.write("</body>\n</html>\n")
+    return destino
+
+
+class ProgressChannel:
+    """Canal de estado entre los hilos de trabajo y el hilo de Tk.
+
+    Los hilos publican el estado de cada control (barra, etiqueta) con una
+    clave; las publicaciones sobre la misma clave se combinan y solo el valor
+    más reciente llega a la interfaz. El hilo de Tk vacía el canal a ritmo
+    fijo con drain(), así la cola de eventos recibe una actualización por
+    control y cuadro en lugar de una por archivo procesado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pendientes = {}  # {clave: (func, kwargs)}
+
+    def post(self, clave, func, **kwargs):
+        """Publica func(**kwargs) para la clave, combinándolo con lo pendiente."""
+        with self._lock:
+            pendiente = self._pendientes.pop(clave, None)
+            if pendiente is not None:
+                kwargs = {**pendiente[1], **kwargs}
+            if threading.current_thread() is not threading.main_thread():
+                self._pendientes[clave] = (func, kwargs)
+                return
+        # Desde el hilo de Tk se aplica al instante, sin dejar un valor viejo en cola
+        func(**kwargs)
+
+    def drain(self):
+        """Aplica el último estado de cada clave; se llama desde el hilo de Tk."""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        for func, kwargs in pendientes.values():
+            try:
+                func(**kwargs)
+            except Exception:
+                pass  # El control pudo destruirse mientras el valor esperaba
+
+
+class LogSink:
+    """Destino de la bitácora de las consolas de la interfaz.
+
+    Cada línea se escribe completa en un archivo rotativo y se acumula en
+    memoria hasta que el hilo de Tk llama a drain(), que inserta todas las
+    líneas pendientes de una consola en una sola operación y recorta la
+    consola a sus últimas max_lines líneas.
+    """
+
+    def __init__(self, log_file=LOG_FILE, max_lines=LOG_CONSOLE_MAX_LINES):
+        self.max_lines = max_lines
+        self._lock = threading.Lock()
+        self._pendientes = {}  # {consola: [líneas]}
+        self._nombres = {}     # {consola: nombre en el archivo de bitácora}
+        self.logger = logging.getLogger("fttxg")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if log_file and not self.logger.handlers:
+            try:
+                handler = RotatingFileHandler(
+                    log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+                )
+            except OSError:
+                handler = None  # Sin archivo de bitácora, las consolas siguen funcionando
+            if handler is not None:
+                handler.setFormatter(logging.Formatter("%(asctime)s [%(consola)s] %(message)s"))
+                self.logger.addHandler(handler)
+
+    def register(self, consola, nombre):
+        self._nombres[consola] = nombre
+
+    def write(self, consola, mensaje):
+        """Registra una línea (o varias) para la consola; seguro desde cualquier hilo."""
+        self.logger.info(mensaje, extra={"consola": self._nombres.get(consola, "app")})
+        with self._lock:
+            self._pendientes.setdefault(consola, []).append(mensaje)
+
+    def clear(self, consola):
+        """Vacía la consola descartando lo que aún no se mostraba; desde el hilo de Tk."""
+        with self._lock:
+            self._pendientes.pop(consola, None)
+        consola.delete("1.0", "end")
+
+    def drain(self):
+        """Inserta las líneas pendientes de cada consola; se llama desde el hilo de Tk."""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        for consola, lineas in pendientes.items():
+            try:
+                consola.insert("end", "\n".join(lineas) + "\n")
+                total = int(consola.index("end-1c").split(".")[0])
+                if total > self.max_lines:
+                    consola.delete("1.0", f"{total - self.max_lines}.0")
+                consola.see("end")
+            except Exception:
+                pass  # La consola pudo destruirse mientras las líneas esperaban
+
+
+def abrir_reducida(path, max_size):
+    """Abre una foto ya orientada, en RGB o L y reducida para caber en max_size.
+
+    En JPEG se pide al decodificador una escala reducida (draft) antes de
+    corregir la orientación, así una foto de 4000x3000 se decodifica a
+    1/4 u 1/8 de su tamaño en lugar de entera.
+    """
+    img = Image.open(path)
+
+    exif = img.getexif()
+    orientation = 1
+    if exif:
+        exif_dict = {ExifTags.get(k, k): v for k, v in exif.items()}
+        orientation = exif_dict.get('Orientation', 1)
+
+    # Decodificar a escala reducida; si la foto va girada, la caja se invierte
+    caja = max_size[::-1] if orientation in (5, 6, 7, 8) else max_size
+    img.draft("RGB", caja)
+
+    # Corregir orientación EXIF
+    if orientation == 3:
+        img = img.rotate(180, expand=True)
+    elif orientation == 6:
+        img = img.rotate(270, expand=True)
+    elif orientation == 8:
+        img = img.rotate(90, expand=True)
+
+    # JPEG solo admite RGB/L: la transparencia de PNG/GIF se aplana sobre blanco
+    if img.mode not in ("RGB", "L"):
+        if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+            img = img.convert("RGBA")
+            fondo = Image.new("RGB", img.size, (255, 255, 255))
+            fondo.paste(img, mask=img.getchannel("A"))
+            img = fondo
+        else:
+            img = img.convert("RGB")
+
+    # Redimensionar
+    img.thumbnail(max_size, Image.LANCZOS, reducing_gap=3.0)
+    return img
+
+
+def codificar_jpeg(img, ajustes):
+    """Codifica img en memoria con la calidad y el submuestreo de ajustes y devuelve los bytes."""
+    opciones = dict(quality=ajustes["quality"], dpi=(600, 600), subsampling=ajustes["subsampling"])
+    salida = io.BytesIO()
+    try:
+        img.save(salida, "JPEG", optimize=ajustes["optimize"], **opciones)
+    except OSError:
+        # Pillow no puede optimizar en memoria si el JPEG supera su búfer (fotos con mucho detalle)
+        salida = io.BytesIO()
+        img.save(salida, "JPEG", **opciones)
+    return salida.getvalue()
+
+
+def abrir_con_reintentos(path, log, max_size):
+    """abrir_reducida con hasta 3 intentos (fotos que aún se sincronizan); None si no se pudo."""
+    for attempt in range(3):  # Reintentar hasta 3 veces
+        try:
+            return abrir_reducida(path, max_size)
+        except Exception as e:
+            log(f"❌ Error procesando {path} (intento {attempt + 1}): {str(e)}")
+            if attempt == 2:  # Último intento
+                log(f"⚠️ Se omitirá la imagen por errores persistentes: {path}")
+                return None
+            time.sleep(1)  # Esperar antes de reintentar
+    return None
+
+
+def redimensionar_imagen(path, log, ajustes=None):
+    """Redimensiona una imagen manteniendo la relación de aspecto y devuelve el JPEG en bytes.
+
+    ajustes es uno de REPORT_PROFILES (o un escalón de escalones_codificacion);
+    por defecto, el perfil de archivo.
+    """
+    ajustes = ajustes or REPORT_PROFILES[DEFAULT_REPORT_PROFILE]
+    img = abrir_con_reintentos(path, log, ajustes["max_size"])
+    if img is None:
+        return None
+    try:
+        return codificar_jpeg(img, ajustes)
+    except Exception as e:
+        log(f"⚠️ Se omitirá la imagen: no se pudo codificar {path}: {str(e)}")
+        return None
+    finally:
+        img.close()  # Liberar memoria
+
+
+class ResizedImageCache(ThumbnailCache):
+    """Caché persistente de las fotos ya redimensionadas para los informes PDF.
+
+    La clave combina el hash de contenido de la foto (que ya cubre su
+    orientación EXIF) con el tamaño, la calidad y el submuestreo de salida, así
+    al regenerar un informe solo se procesan las fotos nuevas o modificadas. Si
+    quien llama entrega el hash ya calculado, un acierto no relee la foto. Hereda de ThumbnailCache el reparto en
+    carpetas y la expulsión LRU por mtime. Varios procesos pueden compartirla:
+    cada archivo se escribe con nombre temporal y se publica con os.replace.
+    """
+
+    def __init__(self, directory=REPORT_IMAGE_CACHE_DIR, max_bytes=REPORT_IMAGE_CACHE_MAX_BYTES, hasher=None):
+        super().__init__(directory, max_bytes)
+        self.hasher = hasher or FileHasher()
+        self._identidades = {}  # (ruta, mtime, tamaño) -> hash, para no releer la foto por cada ajuste
+
+    def _identidad(self, ruta):
+        info = os.stat(ruta)
+        marca = (ruta, info.st_mtime_ns, info.st_size)
+        clave = self._identidades.get(marca)
+        if clave is None:
+            clave = self._identidades[marca] = self.hasher.hash_file(ruta)
+        return clave
+
+    def _destino(self, ruta, ajustes, clave=None):
+        clave = clave or self._identidad(ruta)
+        ancho, alto = ajustes["max_size"]
+        return self._ruta(clave, f"{ancho}x{alto}_q{ajustes['quality']}_s{ajustes['subsampling']}")
+
+    def lookup(self, ruta, ajustes, clave=None):
+        """Devuelve los bytes guardados para ruta con ajustes, o None si no están (sin procesar nada)."""
+        try:
+            destino = self._destino(ruta, ajustes, clave)
+            os.utime(destino)
+            return destino.read_bytes()
+        except OSError:
+            return None
+
+    def load(self, ruta, log, ajustes=None, clave=None):
+        """Devuelve el JPEG redimensionado de ruta en bytes, procesándolo solo si falta (None si falla).
+
+        clave es el hash de contenido de ruta si ya se conoce; si no, se calcula.
+        """
+        ajustes = ajustes or REPORT_PROFILES[DEFAULT_REPORT_PROFILE]
+        datos = self.lookup(ruta, ajustes, clave)
+        if datos is not None:
+            return datos
+        datos = redimensionar_imagen(ruta, log, ajustes)
+        if datos is not None:
+            self.store(ruta, log, ajustes, datos, clave)
+        return datos
+
+    def store(self, ruta, log, ajustes, datos, clave=None):
+        """Guarda los bytes ya procesados de ruta con ajustes; un fallo solo se avisa."""
+        try:
+            destino = self._destino(ruta, ajustes, clave)
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            temporal = destino.with_name(f".{destino.name}.{uuid.uuid4().hex[:8]}.tmp")
+            temporal.write_bytes(datos)
+            os.replace(temporal, destino)
+            self._registrar(len(datos))
+        except OSError as e:
+            log(f"⚠️ No se pudo guardar en caché {ruta}: {str(e)}")  # El informe sigue con la copia en memoria
+
+
+def escalones_codificacion(perfil):
+    """Ajustes de codificación de mayor a menor peso, empezando por el perfil.
+
+    Primero baja la calidad JPEG con submuestreo 4:2:0 y después la
+    resolución; sirve para buscar el primer ajuste que cabe en un tamaño
+    objetivo.
+    """
+    yield perfil
+    ancho, alto = perfil["max_size"]
+    for escala in (1.0, 0.75, 0.5):
+        for calidad in (85, 70, 55, 40):
+            if escala == 1.0 and calidad >= perfil["quality"]:
+                continue
+            yield {
+                "max_size": (int(ancho * escala), int(alto * escala)),
+                "quality": calidad,
+                "subsampling": 2,
+                "optimize": True,
+            }
+
+
+def reducir_a_pagina(ruta, dpi, calidad):
+    """Devuelve la imagen de ruta como JPEG en bytes, reducida a una página A4 apaisada a dpi."""
+    ancho, alto = (int(lado / 72 * dpi) for lado in landscape(A4))
+    with Image.open(ruta) as img:
+        img.draft("RGB", (ancho, alto))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((ancho, alto), Image.LANCZOS)
+        salida = io.BytesIO()
+        img.convert("RGB").save(salida, "JPEG", quality=calidad)
+    return salida.getvalue()
+
+
+def preparar_recursos_informe(ruta_base, log, perfil=None):
+    """Prepara una vez por lote los recursos que comparten todos los informes.
+
+    Devuelve {"fondo_portada": jpeg, "fondo_paginas": jpeg, "pagina_cierre": pdf}
+    en bytes (None si el archivo no existe o no se pudo leer). Los fondos se
+    reducen a los dpi y la calidad de fondo del perfil (el de archivo conserva
+    los archivos originales) y la página de cierre se dibuja una sola vez;
+    cada estación solo los reutiliza. Son bytes para poder enviarse a los
+    procesos de informes.
+    """
+    perfil = perfil or REPORT_PROFILES[DEFAULT_REPORT_PROFILE]
+    recursos = {"fondo_portada": None, "fondo_paginas": None, "pagina_cierre": None}
+    for clave, nombre in REPORT_ASSETS.items():
+        ruta = os.path.join(ruta_base, nombre)
+        if not os.path.exists(ruta):
+            continue
+        try:
+            if perfil.get("fondo_dpi"):
+                imagen = reducir_a_pagina(ruta, perfil["fondo_dpi"], perfil["fondo_calidad"])
+            else:
+                with open(ruta, "rb") as f:
+                    imagen = f.read()
+        except (OSError, SyntaxError) as e:
+            log(f"⚠️ No se pudo preparar {nombre}: {str(e)}")
+            continue
+        if clave == "imagen_final":
+            pagina = io.BytesIO()
+            generar_pdf_imagen_final(ImageReader(io.BytesIO(imagen)), pagina)
+            recursos["pagina_cierre"] = pagina.getvalue()
+        else:
+            recursos[clave] = imagen
+    return recursos
+
+
+def listar_anexos_estacion(carpeta_estacion, eid):
+    """PDFs de la carpeta de la estación que se anexan a su informe, en orden alfabético."""
+    return [
+        os.path.join(carpeta_estacion, f) for f in sorted(os.listdir(carpeta_estacion))
+        if f.lower().endswith('.pdf') and f != f"RP-{eid}.pdf" and "-FINAL" not in f
+    ]
+
+
+@functools.lru_cache(maxsize=8)
+def lector_imagen(datos):
+    """ImageReader único por proceso para unos bytes de imagen: ReportLab decodifica cada fondo una sola vez."""
+    return ImageReader(io.BytesIO(datos))
+
+
+@functools.lru_cache(maxsize=None)
+def cache_imagenes_informe(directory):
+    """Instancia única por proceso del caché de fotos de informes (conserva el total de bytes)."""
+    return ResizedImageCache(directory)
+
+
+def crear_informe_estacion(eid, datos, ruta_base, hilos=REPORT_RESIZE_WORKERS, cache_dir=REPORT_IMAGE_CACHE_DIR,
+                           perfil=None, presupuesto=None, recursos=None, huellas=None):
+    """Crea un informe PDF para una estación, con portada y banner de problemas.
+
+    Es una función de módulo para poder ejecutarse en un proceso aparte: no
+    toca la interfaz y devuelve (ruta_del_informe o None, mensajes) para que
+    quien la llame muestre los mensajes en la consola. hilos es la cantidad de
+    fotos que se redimensionan a la vez y cache_dir la carpeta del caché de
+    fotos redimensionadas (None para no escribir nada en disco). perfil es uno
+    de REPORT_PROFILES; con presupuesto (bytes) se elige el primer escalón de
+    escalones_codificacion cuyas fotos, sumadas a los fondos y PDFs anexos,
+    caben en ese tamaño. recursos es el resultado de preparar_recursos_informe
+    para el lote; si falta, se prepara solo para esta estación. huellas es
+    {ruta de foto: hash de contenido} ya calculado (por el manifiesto): con él
+    un acierto del caché de fotos no vuelve a leer la foto original.
+
+    Las fotos y la página de cierre pasan a ReportLab y PyPDF2 como búferes en
+    memoria: no se crean archivos temporales junto a las fotos. Los búferes se
+    cierran al terminar la estación, haya salido bien o no.
+    """
+    mensajes = []
+    log = mensajes.append
+    buffers = []  # Búferes en memoria vivos hasta que el PDF final está escrito
+    try:
+        carpeta_estacion = os.path.join(ruta_base, eid)
+        nombre_pdf = f"RP-{eid}.pdf"
+        salida_pdf = os.path.join(carpeta_estacion, nombre_pdf)
+        salida_final = os.path.join(carpeta_estacion, f"RP-{eid}-FINAL.pdf")
+
+        # Imágenes de fondo ya preparadas para el lote
+        if recursos is None:
+            recursos = preparar_recursos_informe(ruta_base, log, perfil)
+
+        # Función para fondo dinámico basado en el número de página. Cada fondo se
+        # dibuja una vez por documento dentro de un Form XObject y las demás
+        # páginas solo lo referencian.
+        def fondo_dinamico(canv, doc):
+            clave = "fondo_portada" if doc.page == 1 else "fondo_paginas"
+            if not recursos.get(clave):
+                return
+            canv.saveState()
+            try:
+                if not canv.hasForm(clave):
+                    canv.beginForm(clave)
+                    canv.drawImage(lector_imagen(recursos[clave]), 0, 0, width=A4[1], height=A4[0],
+                                   preserveAspectRatio=True)
+                    canv.endForm()
+                canv.doForm(clave)
+            except Exception as e:
+                log(f"⚠️ Error al aplicar fondo en página {doc.page}: {str(e)}")
+            canv.restoreState()
+
+        # Crear documento PDF con una sola plantilla
+        doc = BaseDocTemplate(salida_pdf, pagesize=landscape(A4))
+        frame = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id="normal")
+
+        # Plantilla única con fondo dinámico
+        plantilla = PageTemplate(id='unica', frames=[frame], onPage=fondo_dinamico)
+        doc.addPageTemplates([plantilla])
+
+        styles = getSampleStyleSheet()
+        s_normal = ParagraphStyle("NormalIzq", parent=styles["Normal"], alignment=TA_LEFT, fontSize=10, leading=14)
+        s_titulo = ParagraphStyle("Titulo", parent=styles["Heading3"], textColor=colors.purple, alignment=TA_LEFT, spaceAfter=6)
+        s_banner = ParagraphStyle("Banner", parent=styles["Heading2"], textColor=colors.white, backColor=colors.red, alignment=TA_LEFT, leading=16)
+
+        story = []
+
+        # --- Portada ---
+        fecha = datos.get('fecha')
+        fecha_str = fecha.strftime('%d/%m/%Y') if hasattr(fecha, 'strftime') else str(fecha) if fecha else '---'
+        hora_visita = datos.get('hora_visita')
+        hora_visita_str = hora_visita.strftime('%H:%M') if hasattr(hora_visita, 'strftime') else str(hora_visita) if hora_visita else '---'
+        hora_salida = datos.get('hora_salida')
+        hora_salida_str = hora_salida.strftime('%H:%M') if hasattr(hora_salida, 'strftime') else str(hora_salida) if hora_salida else '---'
+
+        trabajos_realizados = """
+        <b>TRABAJOS DE MANTENIMIENTO REALIZADOS:</b><br/>
+        - Limpieza de áreas verdes.<br/>
+        - Limpieza de casetas.<br/>
+        - Limpieza general.<br/>
+        - Limpieza equipos de acceso y transmisión.<br/>
+        - Revisión de sistemas AC y SPaT.<br/>
+        - Revisión de equipos de energía y baterías.<br/>
+        - Mantenimiento de MG's.<br/>
+        - Mantenimiento de A/A o ventilación forzada.
+        """
+
+        # Bloque de portada: datos de la estación
+        portada_bloque = []
+        texto_portada = (
+            f"<b>{datos['nombre'].upper()}</b><br/><br/>"
+            f"<b>Tipo:</b> {datos['tipo']}<br/>"
+            f"<b>Coordenadas:</b> {datos['coordenadas']}<br/>"
+            f"<b>Fecha:</b> {fecha_str}<br/>"
+            f"<b>Hora inspección:</b> {hora_visita_str}<br/>"
+            f"<b>Hora salida:</b> {hora_salida_str}<br/><br/>"
+            f"{trabajos_realizados}"
+        )
+
+        portada_bloque.append(Spacer(1, 60))
+        portada_bloque.append(Paragraph(texto_portada, s_normal))
+        story.extend(portada_bloque)
+        story.append(PageBreak())
+
+        # --- Contenido de las páginas siguientes ---
+        # Banner rojo si hay problemas
+        if datos.get("estado", "") == "FALLA" or datos.get("problemas", False):
+            story.append(Spacer(1, 6))
+            banner_tabla = Table(
+                [[Paragraph("ESTACIÓN CON PROBLEMAS", s_banner)]],
+                colWidths=[doc.width]
+            )
+            banner_tabla.setStyle(TableStyle([
+                ("BACKGROUND", (0,0), (-1,-1), colors.red),
+                ("ALIGN", (0,0), (-1,-1), "CENTER"),
+                ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+                ("INNERGRID", (0,0), (-1,-1), 0, colors.red),
+                ("BOX", (0,0), (-1,-1), 0, colors.red),
+                ("TOPPADDING", (0,0), (-1,-1), 6),
+                ("BOTTOMPADDING", (0,0), (-1,-1), 6),
+            ]))
+            story.append(banner_tabla)
+            story.append(Spacer(1, 12))
+
+        # Secciones con fotos
+        orden_secciones = SUBCARPETAS
+
+        fotos_dict = datos["fotos"]
+
+        # Redimensionar todas las fotos de la estación a la vez antes de maquetar.
+        # Pillow libera el GIL al decodificar y remuestrear, así que los hilos sí rinden.
+        # Las fotos que ya están en el caché de informes no se vuelven a procesar.
+        huellas = huellas or {}
+        cache = cache_imagenes_informe(cache_dir) if cache_dir else None
+        if cache:
+            procesar = lambda f, ajustes: cache.load(f, log, ajustes, huellas.get(f))
+        else:
+            procesar = lambda f, ajustes: redimensionar_imagen(f, log, ajustes)
+        perfil = perfil or REPORT_PROFILES[DEFAULT_REPORT_PROFILE]
+        rutas = [f for sec in orden_secciones for f in fotos_dict.get(sec, [])]
+
+        # PDFs que se anexan al informe (se listan antes para estimar el tamaño final)
+        pdfs_extra = listar_anexos_estacion(carpeta_estacion, eid)
+
+        with ThreadPoolExecutor(max_workers=max(1, hilos)) as pool:
+            if not presupuesto:
+                redimensionadas = dict(zip(rutas, pool.map(functools.partial(procesar, ajustes=perfil), rutas)))
+            else:
+                fijos = REPORT_PDF_OVERHEAD_BYTES + sum(os.path.getsize(p) for p in pdfs_extra)
+                fijos += sum(len(recurso) for recurso in recursos.values() if recurso)
+                # Cada foto se decodifica una sola vez, a la caja del perfil, y solo si algún
+                # escalón no está en caché; los escalones se recodifican desde esa imagen en memoria
+                abiertas = {}
+
+                def codificar(f, ajustes):
+                    if cache:
+                        jpeg = cache.lookup(f, ajustes, huellas.get(f))
+                        if jpeg is not None:
+                            return jpeg, False
+                    if f not in abiertas:
+                        abiertas[f] = abrir_con_reintentos(f, log, perfil["max_size"])
+                    if abiertas[f] is None:
+                        return None, False
+                    img = abiertas[f]
+                    if img.width > ajustes["max_size"][0] or img.height > ajustes["max_size"][1]:
+                        img = img.copy()
+                        img.thumbnail(ajustes["max_size"], Image.LANCZOS)
+                    try:
+                        return codificar_jpeg(img, ajustes), True
+                    except Exception as e:
+                        log(f"⚠️ No se pudo codificar {f}: {str(e)}")
+                        return None, False
+
+                try:
+                    for ajustes in escalones_codificacion(perfil):
+                        resultados = dict(zip(rutas, pool.map(functools.partial(codificar, ajustes=ajustes), rutas)))
+                        redimensionadas = {f: jpeg for f, (jpeg, _) in resultados.items()}
+                        if fijos + sum(len(j) for j in redimensionadas.values() if j) <= presupuesto:
+                            break
+                    else:
+                        log(f"⚠️ {eid}: no se alcanza el tamaño objetivo de {presupuesto / 1048576:.1f} MB; se usa el ajuste más liviano.")
+                finally:
+                    for img in abiertas.values():
+                        if img is not None:
+                            img.close()
+                # Solo el ajuste elegido queda en el caché
+                if cache:
+                    for f, (jpeg, nueva) in resultados.items():
+                        if nueva:
+                            cache.store(f, log, ajustes, jpeg, huellas.get(f))
+                if ajustes is not perfil:
+                    log(
+                        f"Ajuste para {presupuesto / 1048576:.1f} MB en {eid}: fotos de "
+                        f"{ajustes['max_size'][0]}x{ajustes['max_size'][1]}, calidad {ajustes['quality']}"
+                    )
+
+        for sec in orden_secciones:
+            fotos = fotos_dict.get(sec, [])
+            if not fotos:
+                continue
+
+            for i in range(0, len(fotos), 3):
+                grupo = fotos[i:i + 3]
+                fila = []
+                col_w = []
+
+                for fpath in grupo:
+                    jpeg = redimensionadas.get(fpath)
+                    if jpeg:
+                        buffer = io.BytesIO(jpeg)
+                        buffers.append(buffer)
+                        img = ReportLabImage(buffer, width=200, height=300)
+                        fila.append(img)
+                        col_w.append(200)
+                        fila.append(Spacer(1, 12))
+                        col_w.append(12)
+
+                if fila and isinstance(fila[-1], Spacer):
+                    fila.pop(); col_w.pop()
+
+                if not fila:
+                    continue
+
+                tabla = Table([fila], colWidths=col_w)
+                tabla.setStyle(TableStyle([
+                    ("ALIGN", (0,0), (-1,-1), "CENTER"),
+                    ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+                    ("BOTTOMPADDING", (0,0), (-1,-1), 12),
+                    ("TOPPADDING", (0,0), (-1,-1), 12),
+                ]))
+
+                bloque = [
+                    Paragraph(f"ESTACIÓN: {datos['nombre'].upper()}", s_titulo),
+                    Paragraph(f"SECCIÓN: {sec}", s_titulo),
+                    Spacer(1, 6),
+                    tabla,
+                    Spacer(1, 20)
+                ]
+                story.append(KeepTogether(bloque))
+
+        # Construir PDF
+        doc.build(story)
+        log(f"✅ Informe generado: {salida_pdf}")
+        redimensionadas.clear()  # Los bytes ya están en el PDF
+
+        # Combinar con otros PDFs si existen
+        pdfs_a_unir = [salida_pdf] + pdfs_extra
+
+        # Agregar imagen final si existe
+        if recursos.get("pagina_cierre"):
+            imagen_final_pdf = io.BytesIO(recursos["pagina_cierre"])
+            buffers.append(imagen_final_pdf)
+            pdfs_a_unir.append(imagen_final_pdf)
+
+        # Unir todos los PDFs
+        salida_resultado = salida_pdf
+        if len(pdfs_a_unir) > 1:
+            merger = PdfMerger()
+            for p in pdfs_a_unir:
+                merger.append(p)
+            merger.write(salida_final)
+            merger.close()
+            log(f"✅ Informe FINAL generado: {salida_final}")
+            salida_resultado = salida_final
+
+        tamano = os.path.getsize(salida_resultado)
+        if presupuesto and tamano > presupuesto:
+            log(f"⚠️ {eid}: el informe ocupa {tamano / 1048576:.1f} MB, por encima del objetivo.")
+
+        return salida_resultado, mensajes
+
+    except Exception as e:
+        log(f"❌ Error generando informe para {eid}: {str(e)}")
+        return None, mensajes
+    finally:
+        for buffer in buffers:
+            buffer.close()
+
+
+def generar_pdf_imagen_final(path_img, path_pdf):
+    """Genera un PDF con una sola imagen (rutas, archivos abiertos o un ImageReader)."""
+    c = canvas.Canvas(path_pdf, pagesize=landscape(A4))
+    c.drawImage(path_img, 0, 0, width=A4[1], height=A4[0])
+    c.showPage()
+    c.save()
+
+
+def renderizar_estaciones(tareas, ruta_base, procesos=1, cancel_event=None, cache_dir=REPORT_IMAGE_CACHE_DIR,
+                          perfil=None, presupuesto=None, recursos=None, huellas=None):
+    """Genera los informes de [(eid, datos)] y entrega (eid, ruta_o_None, mensajes) según terminan.
+
+    Con procesos > 1 las estaciones se reparten en un ProcessPoolExecutor: el
+    redimensionado con Pillow, la maquetación de ReportLab y la unión con
+    PyPDF2 dejan de competir por el GIL. Se mantienen a lo sumo procesos * REPORT_INFLIGHT_PER_WORKER
+    estaciones enviadas; al cancelar se descartan las que siguen en cola y solo
+    se espera a las que ya estaban en curso. Las fotos redimensionadas quedan
+    en cache_dir para las próximas ejecuciones, salvo que sea None. perfil,
+    presupuesto y recursos (de preparar_recursos_informe) se pasan tal cual a
+    crear_informe_estacion; huellas es {eid: {ruta de foto: hash}} y cada
+    estación recibe el suyo.
+    """
+    huellas = huellas or {}
+    cancel_event = cancel_event or threading.Event()
+    if cache_dir:
+        cache_dir = os.path.abspath(cache_dir)  # Los procesos hijos la reciben ya resuelta
+    if procesos <= 1:
+        for eid, datos in tareas:
+            if cancel_event.is_set():
+                return
+            salida, mensajes = crear_informe_estacion(
+                eid, datos, ruta_base, cache_dir=cache_dir, perfil=perfil, presupuesto=presupuesto,
+                recursos=recursos, huellas=huellas.get(eid)
+            )
+            yield eid, salida, mensajes
+        return
+
+    pendientes = iter(tareas)
+    en_vuelo = {}
+    limite = procesos * REPORT_INFLIGHT_PER_WORKER
+    hilos = max(1, REPORT_RESIZE_WORKERS // procesos)  # Los núcleos se reparten entre procesos
+    agotados = False
+    executor = ProcessPoolExecutor(max_workers=procesos)
+    try:
+        while True:
+            while not agotados and len(en_vuelo) < limite and not cancel_event.is_set():
+                try:
+                    eid, datos = next(pendientes)
+                except StopIteration:
+                    agotados = True
+                    break
+                future = executor.submit(
+                    crear_informe_estacion, eid, datos, ruta_base, hilos, cache_dir,
+                    perfil=perfil, presupuesto=presupuesto, recursos=recursos, huellas=huellas.get(eid)
+                )
+                en_vuelo[future] = eid
+            if not en_vuelo or cancel_event.is_set():
+                return
+            # Espera con límite de tiempo para atender la cancelación aunque ninguna estación termine
+            terminados, _ = wait(en_vuelo, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in terminados:
+                eid = en_vuelo.pop(future)
+                try:
+                    salida, mensajes = future.result()
+                except Exception as e:  # Proceso caído o datos que no se pudieron transferir
+                    salida, mensajes = None, [f"❌ Error generando informe para {eid}: {str(e)}"]
+                yield eid, salida, mensajes
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def ruta_manifiesto(ruta_base, eid):
+    return os.path.join(ruta_base, eid, f".RP-{eid}.manifiesto.json")
+
+
+def leer_manifiesto(ruta_base, eid):
+    """Devuelve el manifiesto guardado del informe de eid, o {} si no hay uno válido."""
+    try:
+        with open(ruta_manifiesto(ruta_base, eid), "r", encoding="utf-8") as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifiesto if isinstance(manifiesto, dict) else {}
+
+
+def manifiesto_informe(eid, datos, ruta_base, ajustes, hash_func, previo=None):
+    """Describe todo lo que determina el informe de una estación.
+
+    Incluye la fila del Excel, las fotos en orden de maquetación, los PDFs
+    anexos y los recursos del lote, cada archivo como [ruta relativa, tamaño,
+    mtime, hash], y los ajustes del renderizador. Si tamaño y mtime coinciden
+    con previo se reutiliza su hash; solo se calcula (con hash_func) el de los
+    archivos nuevos o tocados. El resultado ya pasó por JSON, así que se puede
+    comparar directamente con el manifiesto leído del disco.
+    """
+    anteriores = {}
+    for clave in ("fotos", "anexos", "recursos"):
+        for entrada in (previo or {}).get(clave, []):
+            if isinstance(entrada, list) and len(entrada) == 4:
+                anteriores[entrada[0]] = entrada
+
+    def huellas(rutas):
+        resultado = []
+        for ruta in rutas:
+            relativa = os.path.relpath(ruta, ruta_base).replace(os.sep, "/")
+            info = os.stat(ruta)
+            previa = anteriores.get(relativa)
+            if previa and previa[1] == info.st_size and previa[2] == info.st_mtime:
+                resultado.append(previa)
+            else:
+                resultado.append([relativa, info.st_size, info.st_mtime, hash_func(ruta)])
+        return resultado
+
+    fotos = [f for sec in SUBCARPETAS for f in datos["fotos"].get(sec, [])]
+    recursos = [os.path.join(ruta_base, nombre) for nombre in REPORT_ASSETS.values()]
+    manifiesto = {
+        "version": REPORT_MANIFEST_VERSION,
+        "estacion": {clave: str(valor) for clave, valor in datos.items() if clave != "fotos"},  # NaN y fechas como texto
+        "fotos": huellas(fotos),
+        "anexos": huellas(listar_anexos_estacion(os.path.join(ruta_base, eid), eid)),
+        "recursos": huellas([r for r in recursos if os.path.exists(r)]),
+        "ajustes": ajustes,
+    }
+    return json.loads(json.dumps(manifiesto, default=str))
+
+
+def _contenido_manifiesto(manifiesto):
+    """Manifiesto sin mtimes ni datos de salida: un archivo tocado pero idéntico no cuenta como cambio."""
+    contenido = {clave: valor for clave, valor in manifiesto.items() if clave not in ("salida", "generado")}
+    for clave in ("fotos", "anexos", "recursos"):
+        contenido[clave] = [
+            [e[0], e[1], e[3]] if isinstance(e, list) and len(e) == 4 else e
+            for e in contenido.get(clave, [])
+        ]
+    return contenido
+
+
+def informe_vigente(manifiesto, previo, ruta_base, eid):
+    """Devuelve la ruta del informe existente si sus entradas no cambiaron; si no, None."""
+    salida = previo.get("salida")
+    if not salida:
+        return None
+    ruta_salida = os.path.join(ruta_base, eid, salida)
+    if not os.path.exists(ruta_salida):
+        return None
+    return ruta_salida if _contenido_manifiesto(previo) == _contenido_manifiesto(manifiesto) else None
+
+
+def guardar_manifiesto(ruta_base, eid, manifiesto, salida):
+    """Guarda el manifiesto junto al informe recién generado."""
+    destino = ruta_manifiesto(ruta_base, eid)
+    datos = dict(manifiesto, salida=os.path.basename(salida), generado=datetime.now().isoformat(timespec="seconds"))
+    temporal = f"{destino}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False)
+    os.replace(temporal, destino)
+
+
+def elegir_compresion(ruta, muestra=ZIP_SAMPLE_BYTES):
+    """Devuelve (método ZIP, proporción estimada) comprimiendo una muestra de ruta.
+
+    Los PDF llenos de JPEG casi no se comprimen: si la muestra (inicio y mitad
+    del archivo) no ahorra al menos ZIP_MIN_SAVINGS, el archivo se guarda tal cual.
+    """
+    tamano = os.path.getsize(ruta)
+    with open(ruta, "rb") as f:
+        datos = f.read(muestra // 2)
+        if tamano > muestra:
+            f.seek(tamano // 2)
+        datos += f.read(muestra // 2)
+    if not datos:
+        return zipfile.ZIP_STORED, 1.0
+    proporcion = len(zlib.compress(datos, 1)) / len(datos)
+    if proporcion <= 1 - ZIP_MIN_SAVINGS:
+        return zipfile.ZIP_DEFLATED, proporcion
+    return zipfile.ZIP_STORED, 1.0
+
+
+class ReportArchive:
+    """ZIP de informes que se arma mientras se generan.
+
+    add(indice, ruta) recibe el resultado de la estación en la posición indice
+    de la selección (ruta None si no aporta PDF). En cuanto están todas las
+    anteriores, un hilo propio escribe el PDF, así la compresión se solapa con
+    el renderizado, el ZIP queda listo con el último informe y conserva el
+    orden de selección aunque las estaciones terminen desordenadas. Cada archivo se guarda sin comprimir o con DEFLATE según
+    elegir_compresion. Con volumen_max (bytes) se reparte en ZIP independientes
+    <nombre>_parteNN.zip de ese tamaño aproximado; un informe nunca se divide.
+    """
+
+    def __init__(self, carpeta, nombre, volumen_max=None):
+        self.carpeta = Path(carpeta)
+        self.nombre = nombre
+        self.volumen_max = volumen_max
+        self.volumenes = []
+        self.almacenados = 0
+        self.comprimidos = 0
+        self._zip = None
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._retenidos = {}  # {índice: ruta o None} que esperan a una estación anterior
+        self._siguiente = 0
+
+    def add(self, indice, ruta=None):
+        self._retenidos[indice] = ruta
+        while self._siguiente in self._retenidos:
+            ruta = self._retenidos.pop(self._siguiente)
+            self._siguiente += 1
+            if ruta:
+                self._futures.append(self._executor.submit(self._agregar, ruta))
+
+    def _abrir_volumen(self):
+        if self.volumen_max:
+            nombre = f"{self.nombre}_parte{len(self.volumenes) + 1:02d}.zip"
+        else:
+            nombre = f"{self.nombre}.zip"
+        ruta = self.carpeta / nombre
+        self._zip = zipfile.ZipFile(ruta, "w")
+        self.volumenes.append(ruta)
+
+    def _agregar(self, ruta):
+        compresion, proporcion = elegir_compresion(ruta)
+        estimado = int(os.path.getsize(ruta) * min(1.0, proporcion + ZIP_MIN_SAVINGS)) + ZIP_ENTRY_OVERHEAD
+        if (self._zip is not None and self.volumen_max and self._zip.namelist()
+                and self._zip.fp.tell() + estimado > self.volumen_max):
+            self._zip.close()
+            self._zip = None
+        if self._zip is None:
+            self._abrir_volumen()
+        self._zip.write(ruta, Path(ruta).name, compress_type=compresion)
+        if compresion == zipfile.ZIP_STORED:
+            self.almacenados += 1
+        else:
+            self.comprimidos += 1
+
+    def close(self):
+        """Espera las escrituras pendientes y devuelve las rutas de los volúmenes. Propaga los errores.
+
+        Lo que siga retenido (estaciones sin resultado) se escribe en orden de selección.
+        """
+        for indice in sorted(self._retenidos):
+            if self._retenidos[indice]:
+                self._futures.append(self._executor.submit(self._agregar, self._retenidos[indice]))
+        self._retenidos.clear()
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+        return list(self.volumenes)
+
+    def discard(self):
+        """Descarta el archivo: cancela lo pendiente y borra los volúmenes parciales."""
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        if self._zip is not None:
+            try:
+                self._zip.close()
+            except (OSError, ValueError):
+                pass
+            self._zip = None
+        for volumen in self.volumenes:
+            try:
+                volumen.unlink()
+            except OSError:
+                pass
+        self.volumenes = []
+
+
 class MaintenanceApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -89,15 +2687,33 @@ class MaintenanceApp(ctk.CTk):
         self.create_station_widgets = {}
         self.estaciones_cache = None
         self.hash_cache = self.load_hash_cache()
-        self.hash_dirty = False
+        self.hasher = FileHasher.from_preferences(self.preferences)
+        self.perceptual_method = self.preferences.get("perceptual_method", DEFAULT_PERCEPTUAL_METHOD)
+        if self.perceptual_method not in PERCEPTUAL_METHODS:
+            self.perceptual_method = DEFAULT_PERCEPTUAL_METHOD
+        self.hashing = CachedHashing(self.hash_cache, self.hasher, self.perceptual_method)
+        self.thumbnail_cache = ThumbnailCache(hash_func=self.hashing.cached_content_hash)
         self.last_generated_pdf = None  # Para vista previa
         self.duplicates_to_review = []  # Para revisión manual de duplicados
+        self.duplicate_groups_index = {}  # {clave: grupo} de los grupos publicados en vivo
+        self.review_window = None
+        self.duplicates_similar = False  # Los grupos a revisar son similares, no idénticos
+        self.duplicates_incremental = False
+        self.duplicates_history = False  # Comparar también con los meses del historial
         self.cancel_event = threading.Event()
         self.pause_event = threading.Event()
         self.is_paused = False
         self.current_task = None
+        self.progress_channel = ProgressChannel()
+        self.log_sink = LogSink()
+        self.ui_updates_after_id = None
 
         self.setup_ui()
+        self.log_sink.register(self.output_create, "carpetas")
+        self.log_sink.register(self.output_duplicates, "duplicados")
+        self.log_sink.register(self.output_reports, "informes")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.drain_ui_updates()
 
         if self.ruta_base:
             self.apply_saved_base_folder()
@@ -108,46 +2724,72 @@ class MaintenanceApp(ctk.CTk):
 
     def load_preferences(self):
         """Carga preferencias persistentes."""
-        config_path = Path(APP_CONFIG_FILE)
-        if config_path.exists():
-            try:
-                with config_path.open("r", encoding="utf-8") as fh:
-                    return json.load(fh)
-            except (json.JSONDecodeError, OSError):
-                return {}
-        return {}
+        return load_config()
 
     def save_preferences(self):
         """Guarda preferencias persistentes."""
-        config_path = Path(APP_CONFIG_FILE)
-        try:
-            with config_path.open("w", encoding="utf-8") as fh:
-                json.dump(self.preferences, fh, indent=2)
-        except OSError:
-            pass  # Evitar que un error silencie la UI
+        save_config(self.preferences)
 
     def load_hash_cache(self):
-        """Carga el caché de hashes desde un archivo JSON."""
-        cache_path = Path(HASH_CACHE_FILE)
-        if cache_path.exists():
-            try:
-                with cache_path.open('r', encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                return {}
-        return {}
+        """Prepara el caché de hashes; la base SQLite se abre al primer uso."""
+        return HashCacheStore(
+            HASH_CACHE_DB,
+            legacy_json=HASH_CACHE_FILE,
+            identity_fallback=bool(self.preferences.get("hash_identity_fallback", True)),
+        )
         
     def save_hash_cache(self):
-        """Guarda el caché de hashes en un archivo JSON."""
-        if not self.hash_dirty:
+        """Escribe en disco las entradas de hash pendientes."""
+        try:
+            self.hash_cache.flush()
+        except sqlite3.Error:
+            pass
+
+    def export_hash_cache(self):
+        """Exporta el caché de la carpeta base para compartirlo con el equipo."""
+        if not self.validar_ruta():
+            return
+        destino = filedialog.asksaveasfilename(
+            title="Exportar caché de hashes",
+            defaultextension=".fttxgcache",
+            initialfile="cache_hashes.fttxgcache",
+            filetypes=[("Caché de hashes", "*.fttxgcache")],
+        )
+        if not destino:
             return
-        cache_path = Path(HASH_CACHE_FILE)
         try:
-            with cache_path.open('w', encoding="utf-8") as f:
-                json.dump(self.hash_cache, f)
-            self.hash_dirty = False
-        except OSError:
+            total = self.hash_cache.export_bundle(self.ruta_base, destino)
+        except (OSError, sqlite3.Error) as exc:
+            self.show_error("Error", f"No se pudo exportar el caché: {exc}")
+            return
+        self.log_message(self.output_duplicates, f"Caché exportado: {total} entradas en {destino}.")
+
+    def import_hash_cache(self):
+        """Fusiona un caché exportado desde otro equipo en el de la carpeta base."""
+        if not self.validar_ruta():
+            return
+        origen = filedialog.askopenfilename(
+            title="Importar caché de hashes",
+            filetypes=[("Caché de hashes", "*.fttxgcache"), ("Todos los archivos", "*.*")],
+        )
+        if not origen:
+            return
+        try:
+            total = self.hash_cache.import_bundle(self.ruta_base, origen)
+        except (OSError, ValueError, sqlite3.Error) as exc:
+            self.show_error("Error", f"No se pudo importar el caché: {exc}")
+            return
+        self.log_message(self.output_duplicates, f"Caché importado: {total} entradas fusionadas.")
+
+    def on_close(self):
+        """Cierra la aplicación guardando los datos pendientes."""
+        if self.ui_updates_after_id is not None:
+            self.after_cancel(self.ui_updates_after_id)
+        try:
+            self.hash_cache.close()
+        except sqlite3.Error:
             pass
+        self.destroy()
 
     def call_on_ui(self, func, *args, **kwargs):
         """Ejecuta una función en el hilo principal de Tk."""
@@ -165,24 +2807,26 @@ class MaintenanceApp(ctk.CTk):
     def show_warning(self, title, message):
         self.call_on_ui(messagebox.showwarning, title, message)
 
-    def append_text(self, widget, message):
-        widget.insert("end", message + "\n")
-        widget.see("end")
-
     def log_message(self, widget, message):
-        self.call_on_ui(self.append_text, widget, message)
+        self.log_sink.write(widget, message)
 
     def set_label(self, label, **kwargs):
-        self.call_on_ui(label.configure, **kwargs)
+        self.progress_channel.post(("label", id(label)), label.configure, **kwargs)
 
     def set_progress(self, progress_bar, value):
-        self.call_on_ui(progress_bar.set, value)
+        self.progress_channel.post(("progress", id(progress_bar)), progress_bar.set, value=value)
+
+    def drain_ui_updates(self):
+        """Aplica en el hilo de Tk el progreso y la bitácora acumulados, y se reprograma."""
+        self.progress_channel.drain()
+        self.log_sink.drain()
+        self.ui_updates_after_id = self.after(UI_REFRESH_MS, self.drain_ui_updates)
 
     def set_idle_status(self):
         self.set_label(self.status_label, text="Listo.", text_color="gray")
 
     def tick_ui(self):
-        self.call_on_ui(self.update_idletasks)
+        self.progress_channel.post(("tick",), self.update_idletasks)
 
     def update_time_remaining(self, start_time, progreso):
         if not hasattr(self, "time_remaining_label"):
@@ -219,7 +2863,10 @@ class MaintenanceApp(ctk.CTk):
             if pause_state == "disabled":
                 self.call_on_ui(self.pause_duplicates_btn.configure, text="Pausar análisis")
         if getattr(self, "open_duplicates_viewer_btn", None) is not None:
-            viewer_state = "normal" if enabled and self.duplicates_to_review else "disabled"
+            # Los grupos ya encontrados pueden revisarse mientras la búsqueda continúa
+            viewer_state = "disabled"
+            if self.duplicates_to_review and (enabled or self.current_task == "búsqueda de duplicados"):
+                viewer_state = "normal"
             self.call_on_ui(self.open_duplicates_viewer_btn.configure, state=viewer_state)
 
     def run_background_task(self, target, description, *args):
@@ -366,6 +3013,21 @@ class MaintenanceApp(ctk.CTk):
             self.preview_report_btn,
             self.open_duplicates_viewer_btn,
             self.create_scope_selector,
+            self.duplicates_mode_selector,
+            self.similarity_slider,
+            self.incremental_scan_check,
+            self.export_cache_btn,
+            self.import_cache_btn,
+            self.link_duplicates_btn,
+            self.undo_links_btn,
+            self.history_scan_check,
+            self.register_month_btn,
+            self.parallel_reports_check,
+            self.image_cache_reports_check,
+            self.report_profile_selector,
+            self.report_budget_entry,
+            self.zip_volume_entry,
+            self.force_reports_check,
         ]
         
     def setup_inicio_tab(self):
@@ -735,6 +3397,107 @@ class MaintenanceApp(ctk.CTk):
         )
         self.open_duplicates_viewer_btn.grid(row=0, column=1, sticky="ew", padx=(6, 0))
 
+        mode_row = ctk.CTkFrame(controls, fg_color="transparent")
+        mode_row.grid(row=2, column=0, sticky="ew", pady=(14, 0))
+        mode_row.grid_columnconfigure(1, weight=1)
+        ctk.CTkLabel(
+            mode_row,
+            text="Modo de análisis",
+            font=ctk.CTkFont(size=13, weight="bold")
+        ).grid(row=0, column=0, sticky="w")
+        self.duplicates_mode_selector = ctk.CTkSegmentedButton(
+            mode_row,
+            values=["Exactos", "Similares"],
+            command=self.on_duplicates_mode_change
+        )
+        self.duplicates_mode_selector.set(
+            "Similares" if self.preferences.get("duplicates_mode") == "similar" else "Exactos"
+        )
+        self.duplicates_mode_selector.grid(row=0, column=1, sticky="e")
+
+        threshold = int(self.preferences.get("similarity_threshold", DEFAULT_SIMILARITY_THRESHOLD))
+        self.similarity_label = ctk.CTkLabel(
+            mode_row,
+            text=f"Tolerancia de similitud: {threshold}",
+            font=ctk.CTkFont(size=12),
+            text_color=("gray70", "gray80")
+        )
+        self.similarity_label.grid(row=1, column=0, columnspan=2, sticky="w", pady=(8, 0))
+        self.similarity_slider = ctk.CTkSlider(
+            mode_row,
+            from_=0,
+            to=20,
+            number_of_steps=20,
+            command=self.on_similarity_threshold_change
+        )
+        self.similarity_slider.set(threshold)
+        self.similarity_slider.grid(row=2, column=0, columnspan=2, sticky="ew", pady=(4, 0))
+        self.update_similarity_controls()
+
+        self.incremental_scan_var = ctk.BooleanVar(value=bool(self.preferences.get("duplicates_incremental", False)))
+        self.incremental_scan_check = ctk.CTkCheckBox(
+            controls,
+            text="Análisis incremental (solo carpetas modificadas)",
+            variable=self.incremental_scan_var,
+            command=self.on_incremental_scan_change
+        )
+        self.incremental_scan_check.grid(row=3, column=0, sticky="w", pady=(12, 0))
+
+        cache_row = ctk.CTkFrame(controls, fg_color="transparent")
+        cache_row.grid(row=4, column=0, sticky="ew", pady=(12, 0))
+        cache_row.grid_columnconfigure((0,1), weight=1)
+        self.export_cache_btn = ctk.CTkButton(
+            cache_row,
+            text="Exportar caché",
+            command=self.export_hash_cache,
+            height=32
+        )
+        self.export_cache_btn.grid(row=0, column=0, sticky="ew", padx=(0, 6))
+        self.import_cache_btn = ctk.CTkButton(
+            cache_row,
+            text="Importar caché",
+            command=self.import_hash_cache,
+            height=32
+        )
+        self.import_cache_btn.grid(row=0, column=1, sticky="ew", padx=(6, 0))
+
+        reclaim_row = ctk.CTkFrame(controls, fg_color="transparent")
+        reclaim_row.grid(row=5, column=0, sticky="ew", pady=(10, 0))
+        reclaim_row.grid_columnconfigure((0,1), weight=1)
+        self.link_duplicates_btn = ctk.CTkButton(
+            reclaim_row,
+            text="Enlazar duplicados",
+            command=self.link_duplicates,
+            height=32
+        )
+        self.link_duplicates_btn.grid(row=0, column=0, sticky="ew", padx=(0, 6))
+        self.undo_links_btn = ctk.CTkButton(
+            reclaim_row,
+            text="Deshacer enlaces",
+            command=self.undo_links,
+            height=32
+        )
+        self.undo_links_btn.grid(row=0, column=1, sticky="ew", padx=(6, 0))
+
+        history_row = ctk.CTkFrame(controls, fg_color="transparent")
+        history_row.grid(row=6, column=0, sticky="ew", pady=(12, 0))
+        history_row.grid_columnconfigure(0, weight=1)
+        self.history_scan_var = ctk.BooleanVar(value=bool(self.preferences.get("duplicates_history", False)))
+        self.history_scan_check = ctk.CTkCheckBox(
+            history_row,
+            text="Comparar con meses anteriores",
+            variable=self.history_scan_var,
+            command=self.on_history_scan_change
+        )
+        self.history_scan_check.grid(row=0, column=0, sticky="w")
+        self.register_month_btn = ctk.CTkButton(
+            history_row,
+            text="Agregar mes al historial",
+            command=self.register_month,
+            height=32
+        )
+        self.register_month_btn.grid(row=0, column=1, sticky="e", padx=(6, 0))
+
         results_card = ctk.CTkFrame(layout, corner_radius=14)
         results_card.grid(row=0, column=1, rowspan=2, sticky="nsew", pady=(0, 12))
         results_card.grid_columnconfigure(0, weight=1)
@@ -891,14 +3654,80 @@ class MaintenanceApp(ctk.CTk):
         )
         self.generate_reports_btn.grid(row=1, column=0, sticky="ew", padx=18, pady=(0, 12))
 
+        report_options = ctk.CTkFrame(actions_card, fg_color="transparent")
+        report_options.grid(row=2, column=0, sticky="ew", padx=18, pady=(0, 12))
+        report_options.grid_columnconfigure(0, weight=1)
         self.preview_report_btn = ctk.CTkButton(
-            actions_card,
+            report_options,
             text="Abrir último informe generado",
             command=self.preview_report,
             height=36,
             state="disabled"
         )
-        self.preview_report_btn.grid(row=2, column=0, sticky="ew", padx=18, pady=(0, 12))
+        self.preview_report_btn.grid(row=0, column=0, sticky="ew")
+        self.parallel_reports_var = ctk.BooleanVar(value=bool(self.preferences.get("reports_parallel", True)))
+        self.parallel_reports_check = ctk.CTkCheckBox(
+            report_options,
+            text=f"En paralelo ({REPORT_WORKERS} núcleos)",
+            variable=self.parallel_reports_var,
+            command=self.on_parallel_reports_change
+        )
+        self.parallel_reports_check.grid(row=0, column=1, sticky="e", padx=(12, 0))
+        self.image_cache_reports_var = ctk.BooleanVar(value=bool(self.preferences.get("reports_image_cache", True)))
+        self.image_cache_reports_check = ctk.CTkCheckBox(
+            report_options,
+            text="Guardar fotos procesadas en caché",
+            variable=self.image_cache_reports_var,
+            command=self.on_image_cache_reports_change
+        )
+        self.image_cache_reports_check.grid(row=1, column=0, sticky="w", pady=(8, 0))
+        self.force_reports_var = ctk.BooleanVar(value=False)
+        self.force_reports_check = ctk.CTkCheckBox(
+            report_options,
+            text="Regenerar todo",
+            variable=self.force_reports_var
+        )
+        self.force_reports_check.grid(row=1, column=1, sticky="e", padx=(12, 0), pady=(8, 0))
+
+        quality_row = ctk.CTkFrame(report_options, fg_color="transparent")
+        quality_row.grid(row=2, column=0, columnspan=2, sticky="ew", pady=(8, 0))
+        quality_row.grid_columnconfigure(1, weight=1)
+        ctk.CTkLabel(
+            quality_row,
+            text="Calidad",
+            font=ctk.CTkFont(size=13, weight="bold")
+        ).grid(row=0, column=0, sticky="w", padx=(0, 8))
+        self.report_profile_selector = ctk.CTkSegmentedButton(
+            quality_row,
+            values=[nombre.capitalize() for nombre in REPORT_PROFILES],
+            command=self.on_report_profile_change
+        )
+        self.report_profile_selector.set(
+            self.preferences.get("report_profile", DEFAULT_REPORT_PROFILE).capitalize()
+        )
+        self.report_profile_selector.grid(row=0, column=1, sticky="w")
+        self.report_budget_entry = ctk.CTkEntry(
+            quality_row,
+            placeholder_text="Máx. MB",
+            width=80
+        )
+        presupuesto_mb = self.preferences.get("report_budget_mb")
+        if presupuesto_mb:
+            self.report_budget_entry.insert(0, f"{presupuesto_mb:g}")
+        self.report_budget_entry.grid(row=0, column=2, sticky="e", padx=(8, 0))
+        self.report_budget_entry.bind("<FocusOut>", self.on_report_budget_change)
+        self.report_budget_entry.bind("<Return>", self.on_report_budget_change)
+        self.zip_volume_entry = ctk.CTkEntry(
+            quality_row,
+            placeholder_text="ZIP máx. MB",
+            width=95
+        )
+        volumen_mb = self.preferences.get("reports_zip_volume_mb")
+        if volumen_mb:
+            self.zip_volume_entry.insert(0, f"{volumen_mb:g}")
+        self.zip_volume_entry.grid(row=0, column=3, sticky="e", padx=(8, 0))
+        self.zip_volume_entry.bind("<FocusOut>", self.on_zip_volume_change)
+        self.zip_volume_entry.bind("<Return>", self.on_zip_volume_change)
 
         self.output_reports = ctk.CTkTextbox(
             actions_card,
@@ -918,24 +3747,86 @@ class MaintenanceApp(ctk.CTk):
         )
         self.time_remaining_label.pack(anchor="w", pady=(4, 0))
 
-        history_card = ctk.CTkFrame(actions_card, fg_color=("gray15", "gray18"), corner_radius=12)
-        history_card.grid(row=5, column=0, sticky="ew", padx=18, pady=(0, 18))
-        ctk.CTkLabel(
-            history_card,
-            text="Historial reciente",
-            font=ctk.CTkFont(size=13, weight="bold")
-        ).pack(anchor="w", padx=14, pady=(12, 4))
-        self.history_box = ctk.CTkTextbox(history_card, height=120, font=ctk.CTkFont(family="Courier", size=11))
-        self.history_box.pack(fill="x", padx=14, pady=(0, 12))
-        
-    def toggle_all_stations(self):
-        """Toggles the selection state of all station checkboxes."""
-        all_selected = all(var.get() for var in self.station_vars.values())
-        new_state = not all_selected
-        for var in self.station_vars.values():
-            var.set(new_state)
-        self.toggle_all_btn.configure(text="Deseleccionar todas" if new_state else "Seleccionar todas")
-    
+        history_card = ctk.CTkFrame(actions_card, fg_color=("gray15", "gray18"), corner_radius=12)
+        history_card.grid(row=5, column=0, sticky="ew", padx=18, pady=(0, 18))
+        ctk.CTkLabel(
+            history_card,
+            text="Historial reciente",
+            font=ctk.CTkFont(size=13, weight="bold")
+        ).pack(anchor="w", padx=14, pady=(12, 4))
+        self.history_box = ctk.CTkTextbox(history_card, height=120, font=ctk.CTkFont(family="Courier", size=11))
+        self.history_box.pack(fill="x", padx=14, pady=(0, 12))
+        
+    def toggle_all_stations(self):
+        """Toggles the selection state of all station checkboxes."""
+        all_selected = all(var.get() for var in self.station_vars.values())
+        new_state = not all_selected
+        for var in self.station_vars.values():
+            var.set(new_state)
+        self.toggle_all_btn.configure(text="Deseleccionar todas" if new_state else "Seleccionar todas")
+    
+    def on_duplicates_mode_change(self, value):
+        self.preferences["duplicates_mode"] = "similar" if value == "Similares" else "exact"
+        self.save_preferences()
+        self.update_similarity_controls()
+
+    def update_similarity_controls(self):
+        if self.duplicates_mode_selector.get() == "Similares":
+            self.similarity_label.grid()
+            self.similarity_slider.grid()
+        else:
+            self.similarity_label.grid_remove()
+            self.similarity_slider.grid_remove()
+
+    def on_similarity_threshold_change(self, value):
+        threshold = int(round(value))
+        self.similarity_label.configure(text=f"Tolerancia de similitud: {threshold}")
+        self.preferences["similarity_threshold"] = threshold
+        self.save_preferences()
+
+    def on_incremental_scan_change(self):
+        self.preferences["duplicates_incremental"] = bool(self.incremental_scan_var.get())
+        self.save_preferences()
+
+    def on_history_scan_change(self):
+        self.preferences["duplicates_history"] = bool(self.history_scan_var.get())
+        self.save_preferences()
+
+    def on_parallel_reports_change(self):
+        self.preferences["reports_parallel"] = bool(self.parallel_reports_var.get())
+        self.save_preferences()
+
+    def on_image_cache_reports_change(self):
+        self.preferences["reports_image_cache"] = bool(self.image_cache_reports_var.get())
+        self.save_preferences()
+
+    def on_report_profile_change(self, value):
+        self.preferences["report_profile"] = value.lower()
+        self.save_preferences()
+
+    def _guardar_megabytes(self, entry, clave):
+        """Normaliza un campo de MB (vacío o inválido = sin límite) y lo guarda en preferencias."""
+        texto = entry.get().strip().replace(",", ".")
+        try:
+            megabytes = float(texto) if texto else None
+        except ValueError:
+            megabytes = None
+        if megabytes is not None and megabytes <= 0:
+            megabytes = None
+        entry.delete(0, "end")
+        if megabytes:
+            entry.insert(0, f"{megabytes:g}")
+            self.preferences[clave] = megabytes
+        else:
+            self.preferences.pop(clave, None)
+        self.save_preferences()
+
+    def on_report_budget_change(self, _event=None):
+        self._guardar_megabytes(self.report_budget_entry, "report_budget_mb")
+
+    def on_zip_volume_change(self, _event=None):
+        self._guardar_megabytes(self.zip_volume_entry, "reports_zip_volume_mb")
+
     def on_create_scope_change(self, value):
         mode = "selected" if value == "Seleccionadas" else "all"
         self.create_scope_var.set(mode)
@@ -1041,28 +3932,6 @@ class MaintenanceApp(ctk.CTk):
             return False
         return True
         
-    def calcular_hash_archivo(self, ruta_archivo, bloque=65536):
-        """Calcula el hash MD5 de un archivo para comparación."""
-        try:
-            file_stat = os.stat(ruta_archivo)
-        except OSError:
-            return None
-        cache_key = f"{ruta_archivo}_{file_stat.st_mtime}_{file_stat.st_size}"
-        if cache_key in self.hash_cache:
-            return self.hash_cache[cache_key]
-        
-        hasher = hashlib.md5()
-        try:
-            with open(ruta_archivo, 'rb') as f:
-                for datos in iter(lambda: f.read(bloque), b""):
-                    hasher.update(datos)
-            hash_value = hasher.hexdigest()
-            self.hash_cache[cache_key] = hash_value
-            self.hash_dirty = True
-            return hash_value
-        except (IOError, OSError):
-            return None
-            
     def crear_carpetas(self):
         if not self.validar_ruta():
             return
@@ -1096,7 +3965,7 @@ class MaintenanceApp(ctk.CTk):
             if not messagebox.askyesno("Advertencia", f"Ya existen carpetas para: {listado}. ¿Desea continuar?"):
                 return
 
-        self.output_create.delete("1.0", "end")
+        self.log_sink.clear(self.output_create)
         self.set_progress(self.progress_create, 0)
         self.toggle_buttons(False)
         self.set_label(self.status_label, text="Creando estructura de carpetas...", text_color="orange")
@@ -1178,11 +4047,19 @@ class MaintenanceApp(ctk.CTk):
 
         self.pause_event.clear()
         self.is_paused = False
+        # La ventana de revisión abierta apunta a los grupos del análisis anterior
+        if self.review_window is not None and self.review_window.winfo_exists():
+            self.review_window.destroy()
+        self.review_window = None
         self.duplicates_to_review = []
+        self.duplicate_groups_index = {}
+        self.duplicates_similar = self.duplicates_mode_selector.get() == "Similares"
+        self.duplicates_incremental = bool(self.incremental_scan_var.get())
+        self.duplicates_history = bool(self.history_scan_var.get())
         self.open_duplicates_viewer_btn.configure(state="disabled")
         self.toggle_buttons(False)
         self.set_progress(self.progress_duplicates, 0)
-        self.output_duplicates.delete("1.0", "end")
+        self.log_sink.clear(self.output_duplicates)
         for widget in self.duplicates_preview.winfo_children():
             widget.destroy()
         self.set_label(self.status_label, text="Analizando duplicados...", text_color="orange")
@@ -1216,18 +4093,20 @@ class MaintenanceApp(ctk.CTk):
         try:
             self.log_message(self.output_duplicates, "Buscando fotos duplicadas...")
             self.log_message(self.output_duplicates, "Explorando directorios...")
-            duplicados = defaultdict(list)
-
             base_path = Path(self.ruta_base)
-            image_files = []
-            for root, _, files in os.walk(base_path):
-                if "imagenes_temp" in Path(root).parts:
-                    continue
-                for filename in files:
-                    if filename.lower().endswith(IMAGE_EXTENSIONS):
-                        image_files.append(Path(root) / filename)
+            self.hash_cache.register_root(base_path)
+            incremental = self.duplicates_incremental
+            previo = self.hash_cache.load_snapshot(base_path) if incremental else None
+            snapshot, reutilizadas, releidas = escanear_arbol(base_path, previo)
+            self.hash_cache.save_snapshot(base_path, snapshot)
+            if incremental:
+                self.log_message(
+                    self.output_duplicates,
+                    f"Recorrido incremental: {reutilizadas} carpetas sin cambios, {releidas} carpetas releídas."
+                )
+            candidatos = list(snapshot.archivos())
 
-            total_archivos = len(image_files)
+            total_archivos = len(candidatos)
             if total_archivos == 0:
                 self.log_message(self.output_duplicates, "No se encontraron archivos de imagen.")
                 self.show_info("Información", "No se encontraron archivos de imagen en la carpeta seleccionada.")
@@ -1235,53 +4114,62 @@ class MaintenanceApp(ctk.CTk):
                 return
 
             self.log_message(self.output_duplicates, f"Se encontraron {total_archivos} archivos de imagen para analizar.")
-
-            archivos_procesados = 0
-            max_workers = max(2, os.cpu_count() or 2)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_map = {
-                    executor.submit(self.process_file_for_duplicates, path): path
-                    for path in image_files
-                }
-                for future in as_completed(future_map):
-                    if self.cancel_event.is_set():
-                        break
-                    while self.pause_event.is_set() and not self.cancel_event.is_set():
-                        time.sleep(0.2)
-                    if self.cancel_event.is_set():
-                        break
-                    result = future.result()
-                    if result:
-                        file_hash, info = result
-                        duplicados[file_hash].append(info)
-                    archivos_procesados += 1
-                    progreso = archivos_procesados / total_archivos
-                    self.set_progress(self.progress_duplicates, progreso)
-                    porcentaje = progreso * 100
-                    self.set_label(
-                        self.duplicates_progress_label,
-                        text=f"Progreso: {archivos_procesados}/{total_archivos} archivos ({porcentaje:.1f}%)"
-                    )
-                    self.set_label(
-                        self.status_label,
-                        text=f"Analizando duplicados... {porcentaje:.1f}%",
-                        text_color="orange"
-                    )
-                    self.tick_ui()
-                    if archivos_procesados % 50 == 0 or archivos_procesados == total_archivos:
-                        self.log_message(
-                            self.output_duplicates,
-                            f"Avance: {archivos_procesados}/{total_archivos} archivos analizados..."
-                        )
+            similares = self.duplicates_similar
+            if similares:
+                threshold = int(self.preferences.get("similarity_threshold", DEFAULT_SIMILARITY_THRESHOLD))
+                self.log_message(
+                    self.output_duplicates,
+                    f"Modo similares: huella {self.perceptual_method}, tolerancia {threshold} bits."
+                )
+            else:
+                threshold = DEFAULT_SIMILARITY_THRESHOLD
+                self.log_message(self.output_duplicates, f"Motor de hash: {self.hasher.describe()}")
+            finder = self.hashing.make_finder(
+                similares,
+                threshold,
+                cancel_event=self.cancel_event,
+                pause_event=self.pause_event,
+                on_progress=self.report_duplicates_progress,
+                on_group=self.publish_duplicate_group,
+            )
+            grupos_hash = finder.find(candidatos)
 
             if self.cancel_event.is_set():
                 self.log_message(self.output_duplicates, "Búsqueda cancelada por el usuario.")
                 self.set_label(self.status_label, text="Búsqueda cancelada.", text_color="orange")
                 return
 
-            duplicados = {hash_: archivos for hash_, archivos in duplicados.items() if len(archivos) > 1}
+            if not similares:
+                mb_leidos = finder.bytes_leidos / (1024 * 1024)
+                mb_totales = finder.bytes_totales / (1024 * 1024)
+                self.log_message(self.output_duplicates, f"Lectura de disco: {mb_leidos:.1f} MB de {mb_totales:.1f} MB en imágenes.")
+
+            eliminadas = self.hash_cache.purge_missing(base_path, {entrada.ruta for entrada in candidatos})
+            if eliminadas:
+                self.log_message(self.output_duplicates, f"Caché: {eliminadas} entradas obsoletas eliminadas.")
+
+            duplicados = {
+                hash_: [self.build_duplicate_info(ruta) for ruta in rutas]
+                for hash_, rutas in grupos_hash.items()
+            }
+
+            historial = {}
+            if self.duplicates_history:
+                self.log_message(self.output_duplicates, "Comparando con meses anteriores del historial...")
+                historial = HistoryIndex(
+                    self.hash_cache,
+                    self.hashing,
+                    cancel_event=self.cancel_event,
+                    pause_event=self.pause_event,
+                    on_progress=self.report_duplicates_progress,
+                ).find(candidatos, base_path, similares, threshold)
+                if self.cancel_event.is_set():
+                    self.log_message(self.output_duplicates, "Búsqueda cancelada por el usuario.")
+                    self.set_label(self.status_label, text="Búsqueda cancelada.", text_color="orange")
+                    return
+                self.log_history_matches(historial)
 
-            if not duplicados:
+            if not duplicados and not historial:
                 self.log_message(self.output_duplicates, "No se encontraron fotos duplicadas.")
                 self.show_info("Resultado", "No se encontraron fotos duplicadas.")
                 self.set_label(self.status_label, text="Sin duplicados detectados.", text_color="green")
@@ -1290,11 +4178,12 @@ class MaintenanceApp(ctk.CTk):
 
             self.log_message(self.output_duplicates, f"\nSe encontraron {len(duplicados)} grupos de fotos duplicadas:")
 
+            tipo_grupo = "similares" if similares else "idénticos"
             for i, (hash_value, archivos) in enumerate(duplicados.items(), 1):
                 estaciones = sorted({item['estacion'] for item in archivos})
                 self.log_message(
                     self.output_duplicates,
-                    f"Grupo {i}: {len(archivos)} archivos idénticos | Estaciones: {', '.join(estaciones)} | Hash: {hash_value[:10]}..."
+                    f"Grupo {i}: {len(archivos)} archivos {tipo_grupo} | Estaciones: {', '.join(estaciones)} | Hash: {hash_value[:10]}..."
                 )
                 for archivo in archivos[:5]:
                     self.log_message(
@@ -1307,20 +4196,20 @@ class MaintenanceApp(ctk.CTk):
                         f"  ... y {len(archivos) - 5} archivos adicionales."
                     )
 
-            self.duplicates_to_review = list(duplicados.values())
+            # duplicates_to_review ya contiene estos grupos: se publicaron en vivo
             self.call_on_ui(self.open_duplicates_viewer_btn.configure, state="normal")
 
             if self.generate_html_report_flag:
                 self.log_message(self.output_duplicates, "Generando reporte HTML...")
-                html_root = Path(self.ruta_base) / "reportes_duplicados"
+                html_root = Path(self.ruta_base) / REPORTS_DIRNAME
                 ruta_reporte = html_root / HTML_REPORT_NAME
-                ruta_final = self.generar_reporte_html(duplicados, ruta_reporte)
+                ruta_final = self.generar_reporte_html(duplicados, ruta_reporte, similares=similares, historial=historial)
                 self.log_message(self.output_duplicates, f"Reporte generado en: {ruta_final}")
 
-            if self.auto_delete_duplicates_flag:
+            if self.auto_delete_duplicates_flag and not similares:
                 self.delete_duplicates(duplicados)
 
-            self.call_on_ui(self.populate_duplicates_preview, duplicados)
+            self.call_on_ui(self.populate_duplicates_preview, self.duplicates_to_review)
             self.log_message(self.output_duplicates, "\nBúsqueda de duplicados completada.")
             self.show_info("Éxito", f"Se encontraron {len(duplicados)} grupos de duplicados.")
             self.set_label(self.status_label, text="Duplicados analizados.", text_color="green")
@@ -1338,38 +4227,76 @@ class MaintenanceApp(ctk.CTk):
             self.set_label(self.duplicates_progress_label, text="Progreso: 0 elementos procesados.")
             self.finish_task()
 
-    def process_file_for_duplicates(self, ruta_completa):
-        """Procesar archivo para duplicados."""
-        if self.cancel_event.is_set():
-            return None
+    def report_duplicates_progress(self, archivos_procesados, total_archivos):
+        """Actualiza barra, etiquetas y bitácora con el avance del análisis."""
+        progreso = archivos_procesados / total_archivos
+        self.set_progress(self.progress_duplicates, progreso)
+        porcentaje = progreso * 100
+        grupos = len(self.duplicate_groups_index)
+        self.set_label(
+            self.duplicates_progress_label,
+            text=f"Progreso: {archivos_procesados}/{total_archivos} archivos ({porcentaje:.1f}%) · {grupos} grupos"
+        )
+        self.set_label(
+            self.status_label,
+            text=f"Analizando duplicados... {porcentaje:.1f}%",
+            text_color="orange"
+        )
+        self.tick_ui()
+        if archivos_procesados % 50 == 0 or archivos_procesados == total_archivos:
+            self.log_message(
+                self.output_duplicates,
+                f"Avance: {archivos_procesados}/{total_archivos} archivos analizados..."
+            )
+
+    def publish_duplicate_group(self, clave, rutas):
+        """Recibe desde el motor un grupo nuevo o los archivos nuevos de uno existente."""
+        self.call_on_ui(self.add_live_duplicate_group, clave, rutas)
+
+    def add_live_duplicate_group(self, clave, rutas):
+        """Incorpora en el hilo de Tk un grupo publicado durante la búsqueda."""
+        grupo = self.duplicate_groups_index.get(clave)
+        if grupo is None:
+            grupo = []
+            self.duplicate_groups_index[clave] = grupo
+            self.duplicates_to_review.append(grupo)
+        grupo.extend(self.build_duplicate_info(ruta) for ruta in rutas)
+
+        # Solo los primeros grupos aparecen en la vista rápida
+        if len(self.duplicates_to_review) <= 3 or any(grupo is g for g in self.duplicates_to_review[:3]):
+            self.populate_duplicates_preview(self.duplicates_to_review)
+        if self.current_task == "búsqueda de duplicados":
+            self.open_duplicates_viewer_btn.configure(state="normal")
+        if self.review_window is not None and self.review_window.winfo_exists():
+            self.review_window.refresh_groups()
+
+    def build_duplicate_info(self, ruta_completa):
+        """Describe un archivo duplicado (estación, subcarpeta y nombre)."""
         ruta_completa = Path(ruta_completa)
-        file_hash = self.calcular_hash_archivo(str(ruta_completa))
-        if file_hash:
-            base_path = Path(self.ruta_base)
-            try:
-                relative_parts = ruta_completa.relative_to(base_path).parts
-            except ValueError:
-                relative_parts = ruta_completa.parts
-            estacion = relative_parts[0] if len(relative_parts) > 0 else "Desconocida"
-            subcarpeta = relative_parts[1] if len(relative_parts) > 1 else "Desconocida"
-            return file_hash, {
-                'ruta': str(ruta_completa),
-                'estacion': estacion,
-                'subcarpeta': subcarpeta,
-                'nombre_archivo': ruta_completa.name
-            }
-        return None
+        base_path = Path(self.ruta_base)
+        try:
+            relative_parts = ruta_completa.relative_to(base_path).parts
+        except ValueError:
+            relative_parts = ruta_completa.parts
+        estacion = relative_parts[0] if len(relative_parts) > 0 else "Desconocida"
+        subcarpeta = relative_parts[1] if len(relative_parts) > 1 else "Desconocida"
+        return {
+            'ruta': str(ruta_completa),
+            'estacion': estacion,
+            'subcarpeta': subcarpeta,
+            'nombre_archivo': ruta_completa.name
+        }
         
-    def populate_duplicates_preview(self, duplicados):
+    def populate_duplicates_preview(self, grupos):
         """Muestra una vista previa limitada de duplicados en el hilo principal."""
         for widget in self.duplicates_preview.winfo_children():
             widget.destroy()
 
-        max_groups = min(3, len(duplicados))
+        max_groups = min(3, len(grupos))
         if max_groups == 0:
             return
 
-        for idx, archivos in enumerate(list(duplicados.values())[:max_groups], start=1):
+        for idx, archivos in enumerate(grupos[:max_groups], start=1):
             group_frame = ctk.CTkFrame(self.duplicates_preview)
             group_frame.pack(fill="x", padx=4, pady=4)
 
@@ -1384,8 +4311,7 @@ class MaintenanceApp(ctk.CTk):
     def show_image_preview(self, parent, image_path, tooltip):
         """Mostrar vista previa de imagen en la interfaz."""
         try:
-            img = Image.open(image_path)
-            img.thumbnail((100, 100))
+            img = self.thumbnail_cache.get(image_path, 100)
             img_ctk = ctk.CTkImage(light_image=img, size=(100, 100))
             label = ctk.CTkLabel(parent, image=img_ctk, text=tooltip[:18])
             label.image = img_ctk  # Mantener referencia
@@ -1399,7 +4325,10 @@ class MaintenanceApp(ctk.CTk):
             self.show_info("Información", "No hay duplicados para revisar. Primero ejecute la búsqueda.")
             return
             
-        ReviewDuplicatesWindow(self, self.duplicates_to_review)
+        if self.review_window is not None and self.review_window.winfo_exists():
+            self.review_window.focus()
+            return
+        self.review_window = ReviewDuplicatesWindow(self, self.duplicates_to_review, similar=self.duplicates_similar)
             
     def delete_duplicates(self, duplicados):
         """Eliminar duplicados automáticamente, manteniendo la primera copia."""
@@ -1412,65 +4341,166 @@ class MaintenanceApp(ctk.CTk):
                     self.log_message(self.output_duplicates, f"Eliminado: {archivo['ruta']}")
                 except Exception as e:
                     self.log_message(self.output_duplicates, f"Error al eliminar: {str(e)}")
-    def generar_reporte_html(self, duplicados, ruta_reporte):
-        """Genera un reporte HTML con los resultados y devuelve la ruta escrita."""
-        ruta_reporte = Path(ruta_reporte)
-        ruta_reporte.parent.mkdir(parents=True, exist_ok=True)
-        destino = ruta_reporte
-        if destino.exists():
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            destino = ruta_reporte.with_name(f"{ruta_reporte.stem}_{timestamp}{ruta_reporte.suffix}")
-
-        html = f"""
-        <html>
-        <head>
-            <title>Reporte de Fotos Duplicadas</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                .grupo {{ border: 1px solid #ddd; padding: 15px; margin-bottom: 20px; border-radius: 5px; }}
-                .foto {{ margin: 10px 0; padding: 10px; background-color: #f9f9f9; border-left: 4px solid #4CAF50; }}
-                h1 {{ color: #333; }}
-                h2 {{ color: #444; }}
-                .hash {{ font-family: monospace; color: #666; }}
-                .estacion {{ font-weight: bold; color: #2c3e50; }}
-                .subcarpeta {{ color: #7f8c8d; }}
-                img {{ max-width: 100px; height: auto; }}
-            </style>
-        </head>
-        <body>
-            <h1>Reporte de Fotos Duplicadas</h1>
-            <p>Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}</p>
-            <p>Directorio analizado: {self.ruta_base}</p>
-            <p>Se encontraron {len(duplicados)} grupos de fotos duplicadas.</p>
-        """
 
-        for i, (hash_value, archivos) in enumerate(duplicados.items(), 1):
-            html += f"""
-            <div class="grupo">
-                <h2>Grupo {i} - {len(archivos)} fotos idénticas</h2>
-                <p class="hash">Hash: {hash_value}</p>
-            """
+    def link_duplicates(self):
+        """Reemplaza las copias de cada grupo por enlaces a la primera, sin perder rutas."""
+        if not self.validar_ruta():
+            return
+        if not self.duplicates_to_review:
+            self.show_info("Información", "No hay duplicados para enlazar. Primero ejecute la búsqueda.")
+            return
+        if self.duplicates_similar:
+            self.show_warning("Modo similares", "Solo se pueden enlazar duplicados exactos. Ejecute la búsqueda en modo Exactos.")
+            return
+        grupos = [[archivo['ruta'] for archivo in grupo] for grupo in self.duplicates_to_review if len(grupo) > 1]
+        copias = sum(len(grupo) - 1 for grupo in grupos)
+        if not messagebox.askyesno(
+            "Enlazar duplicados",
+            f"Se reemplazarán {copias} copia(s) por enlaces a la primera foto de cada grupo.\n\n"
+            "Todas las fotos seguirán en sus secciones y el cambio puede deshacerse."
+        ):
+            return
+        if self.run_background_task(self._enlazar_duplicados_thread, "enlace de duplicados", grupos):
+            self.toggle_buttons(False)
+            self.set_label(self.status_label, text="Enlazando duplicados...", text_color="orange")
+
+    def _enlazar_duplicados_thread(self, grupos):
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        journal = Path(self.ruta_base) / REPORTS_DIRNAME / f"{RECLAIM_JOURNAL_PREFIX}{timestamp}.jsonl"
+        reclaimer = DuplicateReclaimer(
+            journal,
+            method=self.preferences.get("reclaim_method", DEFAULT_RECLAIM_METHOD),
+            cancel_event=self.cancel_event,
+        )
+        try:
+            for indice, grupo in enumerate(grupos, 1):
+                if self.cancel_event.is_set():
+                    self.log_message(self.output_duplicates, "Enlace de duplicados cancelado.")
+                    break
+                self.log_message(self.output_duplicates, f"Manteniendo: {grupo[0]}")
+                for ruta, metodo, error in reclaimer.reclaim_group(grupo):
+                    if error:
+                        self.log_message(self.output_duplicates, f"No se enlazó {ruta}: {error}")
+                    elif metodo:
+                        self.log_message(self.output_duplicates, f"Enlazado ({metodo}): {ruta}")
+                self.set_progress(self.progress_duplicates, indice / len(grupos))
+            mb = reclaimer.bytes_recuperados / (1024 * 1024)
+            self.log_message(
+                self.output_duplicates,
+                f"Se enlazaron {reclaimer.enlazados} copias ({mb:.1f} MB recuperados). Diario: {journal}"
+            )
+            self.set_label(self.status_label, text="Duplicados enlazados.", text_color="green")
+        except Exception as e:
+            self.log_message(self.output_duplicates, f"Error: {str(e)}")
+            self.show_error("Error", f"Ocurrió un error al enlazar: {str(e)}")
+            self.set_label(self.status_label, text="Error al enlazar duplicados.", text_color="red")
+        finally:
+            reclaimer.close()
+            self.set_progress(self.progress_duplicates, 0)
+            self.finish_task()
+
+    def undo_links(self):
+        """Deshace el último enlace de duplicados registrado en la carpeta base."""
+        if not self.validar_ruta():
+            return
+        journal = ultimo_diario_enlaces(self.ruta_base)
+        if journal is None:
+            self.show_info("Información", "No hay enlaces de duplicados para deshacer.")
+            return
+        if not messagebox.askyesno(
+            "Deshacer enlaces",
+            f"Se restaurarán como archivos independientes las copias enlazadas en {journal.name}."
+        ):
+            return
+        if self.run_background_task(self._deshacer_enlaces_thread, "reversión de enlaces", journal):
+            self.toggle_buttons(False)
+            self.set_label(self.status_label, text="Restaurando copias...", text_color="orange")
+
+    def _deshacer_enlaces_thread(self, journal):
+        try:
+            restaurados, errores = revertir_enlaces(journal)
+            for error in errores:
+                self.log_message(self.output_duplicates, f"No se restauró {error}")
+            self.log_message(self.output_duplicates, f"Se restauraron {restaurados} copias desde {journal.name}.")
+            if errores:
+                self.set_label(self.status_label, text="Reversión incompleta.", text_color="orange")
+            else:
+                self.set_label(self.status_label, text="Enlaces revertidos.", text_color="green")
+        except (OSError, ValueError) as e:
+            self.log_message(self.output_duplicates, f"Error: {str(e)}")
+            self.show_error("Error", f"No se pudo deshacer el enlace: {str(e)}")
+            self.set_label(self.status_label, text="Error al deshacer enlaces.", text_color="red")
+        finally:
+            self.finish_task()
 
-            for archivo in archivos:
-                html += f"""
-                <div class="foto">
-                    <p class="estacion">Estación: {archivo['estacion']}</p>
-                    <p class="subcarpeta">Subcarpeta: {archivo['subcarpeta']}</p>
-                    <p>Archivo: {archivo['nombre_archivo']}</p>
-                    <p>Ruta: {archivo['ruta']}</p>
-                    <img src="{archivo['ruta']}" alt="{archivo['nombre_archivo']}">
-                </div>
-                """
+    def generar_reporte_html(self, duplicados, ruta_reporte, similares=False, historial=None):
+        """Genera el reporte HTML paginado con los resultados y devuelve la ruta del índice."""
+        return escribir_reporte_duplicados(
+            duplicados,
+            ruta_reporte,
+            self.ruta_base,
+            similares=similares,
+            miniaturas_cache=self.thumbnail_cache,
+            historial={ruta: (self.build_duplicate_info(ruta), origenes) for ruta, origenes in (historial or {}).items()},
+        )
 
-            html += "</div>"
+    def log_history_matches(self, historial):
+        """Escribe en la bitácora las fotos que ya aparecían en meses anteriores."""
+        if not historial:
+            self.log_message(self.output_duplicates, "Ninguna foto coincide con meses anteriores.")
+            return
+        self.log_message(self.output_duplicates, f"\n{len(historial)} fotos ya aparecían en meses anteriores:")
+        for ruta, origenes in historial.items():
+            info = self.build_duplicate_info(ruta)
+            self.log_message(
+                self.output_duplicates,
+                f"  - {info['estacion']} / {info['subcarpeta']} / {info['nombre_archivo']}"
+            )
+            for mes, origen in origenes[:3]:
+                self.log_message(self.output_duplicates, f"      ← {mes}: {origen}")
+            if len(origenes) > 3:
+                self.log_message(self.output_duplicates, f"      ... y {len(origenes) - 3} coincidencias más.")
 
-        html += "</body></html>"
+    def register_month(self):
+        """Agrega la carpeta base al historial global de fotos."""
+        if not self.validar_ruta():
+            return
+        perceptual = self.duplicates_mode_selector.get() == "Similares"
+        if self.run_background_task(self._registrar_mes_thread, "registro en historial", perceptual):
+            self.toggle_buttons(False)
+            self.set_label(self.status_label, text="Registrando mes en el historial...", text_color="orange")
 
-        with destino.open('w', encoding='utf-8') as archivo_html:
-            archivo_html.write(html)
+    def _registrar_mes_thread(self, perceptual):
+        try:
+            nombre = nombre_mes(self.ruta_base)
+            detalle = " con huellas perceptuales" if perceptual else ""
+            self.log_message(self.output_duplicates, f"Registrando {nombre} en el historial{detalle}...")
+            indice = HistoryIndex(
+                self.hash_cache,
+                self.hashing,
+                cancel_event=self.cancel_event,
+                pause_event=self.pause_event,
+                on_progress=self.report_duplicates_progress,
+            )
+            fotos = indice.register(self.ruta_base, nombre, perceptual=perceptual)
+            if self.cancel_event.is_set():
+                self.log_message(self.output_duplicates, "Registro cancelado por el usuario.")
+                self.set_label(self.status_label, text="Registro cancelado.", text_color="orange")
+                return
+            self.log_message(self.output_duplicates, f"{nombre} registrado en el historial: {fotos} fotos.")
+            meses = self.hash_cache.list_months()
+            self.log_message(self.output_duplicates, f"Meses en el historial: {', '.join(m[0] for m in meses)}")
+            self.set_label(self.status_label, text="Mes registrado en el historial.", text_color="green")
+        except (OSError, sqlite3.Error) as e:
+            self.log_message(self.output_duplicates, f"Error: {str(e)}")
+            self.show_error("Error", f"No se pudo registrar el mes: {str(e)}")
+            self.set_label(self.status_label, text="Error al registrar el mes.", text_color="red")
+        finally:
+            self.save_hash_cache()
+            self.set_progress(self.progress_duplicates, 0)
+            self.set_label(self.duplicates_progress_label, text="Progreso: 0 elementos procesados.")
+            self.finish_task()
 
-        return destino
-    
     def generar_informes(self):
         if not self.validar_ruta():
             return
@@ -1484,18 +4514,22 @@ class MaintenanceApp(ctk.CTk):
             self.show_warning("Aviso", "Por favor, seleccione al menos una estación para generar informes.")
             return
 
-        self.output_reports.delete("1.0", "end")
+        self.on_report_budget_change()  # Tomar el tamaño objetivo aunque el campo no haya perdido el foco
+        self.on_zip_volume_change()
+
+        self.log_sink.clear(self.output_reports)
         self.set_progress(self.progress_reports, 0)
         self.set_label(self.time_remaining_label, text="Tiempo restante estimado: --:--")
         self.toggle_buttons(False)
         self.set_label(self.status_label, text="Generando informes...", text_color="orange")
 
-        if not self.run_background_task(self._generar_informes_thread, "generación de informes", df, seleccionadas):
+        forzar = bool(self.force_reports_var.get())
+        if not self.run_background_task(self._generar_informes_thread, "generación de informes", df, seleccionadas, forzar):
             self.toggle_buttons(True)
             self.set_idle_status()
         
-    def _generar_informes_thread(self, df, seleccionadas):
-        ruta_temporal = Path(self.ruta_base) / "imagenes_temp"
+    def _generar_informes_thread(self, df, seleccionadas, forzar=False):
+        archivo = None
         try:
             self.log_message(self.output_reports, "Iniciando generación de informes...")
 
@@ -1519,9 +4553,6 @@ class MaintenanceApp(ctk.CTk):
             
             self.log_message(self.output_reports, f"Se cargaron {len(estaciones)} estaciones.")
 
-            def normalizar_seccion(nombre):
-                return re.sub(r'\s*\(?(I{1,3}|IV|V{1,3})\)?$', '', nombre).strip()
-
             total_estaciones = len([eid for eid in seleccionadas if eid in estaciones])
             if total_estaciones == 0:
                 self.log_message(self.output_reports, "No hay estaciones válidas seleccionadas para procesar.")
@@ -1529,73 +4560,173 @@ class MaintenanceApp(ctk.CTk):
                 self.set_label(self.status_label, text="Sin estaciones válidas.", text_color="orange")
                 return
 
-            ruta_temporal.mkdir(parents=True, exist_ok=True)
-            self.log_message(self.output_reports, "Generando informes PDF...")
-            start_time = time.time()
-            generados_paths = []
-            procesadas_validas = 0
-
+            carpetas_existentes = listar_subdirectorios(self.ruta_base)
+            tareas = []
             for eid in seleccionadas:
-                if self.cancel_event.is_set():
-                    self.log_message(self.output_reports, "Generación cancelada por el usuario.")
-                    self.set_label(self.status_label, text="Generación cancelada.", text_color="orange")
-                    break
-
                 if eid not in estaciones:
                     self.log_message(self.output_reports, f"⚠️ Estación {eid} no encontrada en el Excel.")
                     continue
 
                 datos = estaciones[eid]
                 carpeta = Path(self.ruta_base) / eid
-                if not carpeta.is_dir():
+                # Sin coincidencia exacta se pregunta al sistema: en discos que no distinguen
+                # mayúsculas (macOS, Windows) "e01" abre la carpeta "E01"
+                if eid not in carpetas_existentes and not carpeta.is_dir():
                     self.log_message(self.output_reports, f"⚠️ No existe carpeta para la estación: {eid}")
                     continue
 
-                datos["fotos"] = {}
-                for subdir in carpeta.iterdir():
-                    if not subdir.is_dir():
-                        continue
-                    seccion = normalizar_seccion(subdir.name)
-                    if seccion not in SUBCARPETAS:
-                        continue
-                    fotos = [
-                        str(f)
-                        for f in subdir.iterdir()
-                        if f.suffix.lower() in IMAGE_EXTENSIONS
-                    ]
-                    if fotos:
-                        datos["fotos"].setdefault(seccion, []).extend(sorted(fotos))
+                datos["fotos"] = listar_fotos_estacion(carpeta)
 
                 if not datos["fotos"]:
                     self.log_message(self.output_reports, f"⚠️ La estación {eid} no tiene fotos clasificadas.")
                     continue
+                tareas.append((eid, datos))
+
+            cache_dir = REPORT_IMAGE_CACHE_DIR if self.preferences.get("reports_image_cache", True) else None
+            nombre_perfil = self.preferences.get("report_profile", DEFAULT_REPORT_PROFILE)
+            perfil = REPORT_PROFILES.get(nombre_perfil, REPORT_PROFILES[DEFAULT_REPORT_PROFILE])
+            presupuesto_mb = self.preferences.get("report_budget_mb")
+            presupuesto = int(presupuesto_mb * 1024 * 1024) if presupuesto_mb else None
+            if presupuesto:
+                self.log_message(
+                    self.output_reports,
+                    f"Perfil de calidad: {nombre_perfil}, tamaño objetivo {presupuesto_mb:g} MB por informe."
+                )
+            else:
+                self.log_message(self.output_reports, f"Perfil de calidad: {nombre_perfil}.")
+
+            # Omitir las estaciones cuyo informe ya refleja sus entradas actuales
+            ajustes = {"perfil": perfil, "presupuesto": presupuesto}
+            volumen_mb = self.preferences.get("reports_zip_volume_mb")
+            orden = {eid: indice for indice, (eid, _) in enumerate(tareas)}
+            archivo = ReportArchive(
+                self.ruta_base,
+                f"reportes_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                int(volumen_mb * 1024 * 1024) if volumen_mb else None,
+            )
+            self.hash_cache.register_root(self.ruta_base)
+            generados = {}
+            manifiestos = {}
+            pendientes = []
+
+            def revisar(tarea):
+                eid, datos = tarea
+                previo = leer_manifiesto(self.ruta_base, eid)
+                if self.cancel_event.is_set():
+                    return previo, None
+                try:
+                    return previo, manifiesto_informe(
+                        eid, datos, self.ruta_base, ajustes, self.hashing.content_hash, previo
+                    )
+                except OSError as e:
+                    self.log_message(self.output_reports, f"⚠️ No se pudo revisar {eid}; se regenerará: {str(e)}")
+                    return previo, None
+
+            with ThreadPoolExecutor(max_workers=REPORT_RESIZE_WORKERS) as pool:
+                revisiones = list(pool.map(revisar, tareas))
+            for (eid, datos), (previo, manifiesto) in zip(tareas, revisiones):
+                vigente = None
+                if manifiesto is not None:
+                    manifiestos[eid] = manifiesto
+                    if not forzar:
+                        vigente = informe_vigente(manifiesto, previo, self.ruta_base, eid)
+                if vigente:
+                    generados[eid] = vigente
+                    archivo.add(orden[eid], vigente if vigente.endswith("-FINAL.pdf") else None)
+                    if any(previo.get(clave) != manifiesto.get(clave) for clave in ("fotos", "anexos", "recursos")):
+                        # Solo cambiaron mtimes: se guardan para no volver a calcular esos hashes
+                        try:
+                            guardar_manifiesto(self.ruta_base, eid, manifiesto, vigente)
+                        except OSError:
+                            pass
+                    self.log_message(self.output_reports, f"⏭️ {eid} sin cambios; se reutiliza {os.path.basename(vigente)}")
+                else:
+                    pendientes.append((eid, datos))
+            self.save_hash_cache()
+            if forzar:
+                self.log_message(self.output_reports, "Regeneración forzada: se rehacen todos los informes.")
+            elif generados:
+                self.log_message(
+                    self.output_reports,
+                    f"{len(generados)} informes sin cambios, {len(pendientes)} por generar."
+                )
+
+            procesos = min(REPORT_WORKERS, len(pendientes)) if self.preferences.get("reports_parallel", True) else 1
+            if procesos > 1:
+                self.log_message(self.output_reports, f"Generando informes PDF en {procesos} procesos...")
+            elif pendientes:
+                self.log_message(self.output_reports, "Generando informes PDF...")
+            start_time = time.time()
+            recursos = preparar_recursos_informe(
+                self.ruta_base, lambda mensaje: self.log_message(self.output_reports, mensaje), perfil
+            ) if pendientes else None
+            procesadas_validas = 0
 
+            for eid, datos in pendientes[:procesos]:
                 self.log_message(self.output_reports, f"Generando informe para {eid} ({datos['nombre'] or 'Sin nombre'})...")
-                pdf_generado = self.crear_informe_estacion(eid, datos, self.ruta_base, str(ruta_temporal))
+            restantes = iter(pendientes[procesos:])
+            # Los hashes de las fotos ya salieron del manifiesto: el caché de fotos no las relee
+            huellas = {
+                eid: {
+                    ruta: entrada[3]
+                    for ruta, entrada in zip(
+                        [f for sec in SUBCARPETAS for f in datos["fotos"].get(sec, [])],
+                        manifiestos[eid]["fotos"],
+                    )
+                    if entrada[3]
+                }
+                for eid, datos in pendientes if eid in manifiestos
+            }
+            for eid, pdf_generado, mensajes in renderizar_estaciones(
+                pendientes, self.ruta_base, procesos, self.cancel_event, cache_dir, perfil, presupuesto, recursos,
+                huellas
+            ):
+                for mensaje in mensajes:
+                    self.log_message(self.output_reports, mensaje)
+                # Se comprime mientras siguen las demás estaciones, en orden de selección
+                archivo.add(orden[eid], pdf_generado if pdf_generado and pdf_generado.endswith("-FINAL.pdf") else None)
                 if pdf_generado:
-                    generados_paths.append(pdf_generado)
+                    generados[eid] = pdf_generado
                     self.last_generated_pdf = pdf_generado
+                    try:
+                        if eid in manifiestos:
+                            guardar_manifiesto(self.ruta_base, eid, manifiestos[eid], pdf_generado)
+                    except OSError as e:
+                        self.log_message(self.output_reports, f"⚠️ No se pudo guardar el manifiesto de {eid}: {str(e)}")
                     self.log_message(
                         self.history_box,
                         f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Informe generado para estación {eid}"
                     )
 
                 procesadas_validas += 1
-                progreso = procesadas_validas / total_estaciones
+                progreso = procesadas_validas / len(pendientes)
                 self.set_progress(self.progress_reports, progreso)
                 self.update_time_remaining(start_time, progreso)
+                siguiente = next(restantes, None)
+                if siguiente is not None and not self.cancel_event.is_set():
+                    self.log_message(
+                        self.output_reports,
+                        f"Generando informe para {siguiente[0]} ({siguiente[1]['nombre'] or 'Sin nombre'})..."
+                    )
 
             if self.cancel_event.is_set():
+                archivo.discard()
+                archivo = None
+                self.log_message(self.output_reports, "Generación cancelada por el usuario. ZIP parcial eliminado.")
+                self.set_label(self.status_label, text="Generación cancelada.", text_color="orange")
                 return
 
-            if generados_paths:
-                zip_name = f"reportes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-                zip_path = Path(self.ruta_base) / zip_name
-                with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-                    for pdf in generados_paths:
-                        if pdf.endswith("-FINAL.pdf"):
-                            zf.write(pdf, Path(pdf).name)
-                self.log_message(self.output_reports, f"✅ ZIP creado: {zip_path} (solo PDFs finales)")
+            volumenes = archivo.close()
+            resumen = f"{archivo.almacenados} sin comprimir, {archivo.comprimidos} comprimidos"
+            archivo = None
+            if generados:
+                for volumen in volumenes:
+                    self.log_message(
+                        self.output_reports,
+                        f"✅ ZIP creado: {volumen} ({volumen.stat().st_size / 1048576:.1f} MB, solo PDFs finales)"
+                    )
+                if volumenes:
+                    self.log_message(self.output_reports, f"PDFs en el ZIP: {resumen}.")
                 self.log_message(self.output_reports, "Proceso de generación de informes completado.")
                 self.show_info("Éxito", "Los informes se han generado correctamente.")
                 self.set_label(self.status_label, text="Informes generados correctamente.", text_color="green")
@@ -1605,235 +4736,15 @@ class MaintenanceApp(ctk.CTk):
                 self.set_label(self.status_label, text="Sin informes generados.", text_color="orange")
             
         except Exception as e:
+            if archivo is not None:
+                archivo.discard()
             self.log_message(self.output_reports, f"Error: {str(e)}")
             self.show_error("Error", f"Ocurrió un error: {str(e)}")
             self.set_label(self.status_label, text="Error al generar informes.", text_color="red")
         finally:
-            if ruta_temporal.exists():
-                shutil.rmtree(ruta_temporal, ignore_errors=True)
-                self.log_message(self.output_reports, f"Carpeta temporal {ruta_temporal} eliminada.")
             self.set_progress(self.progress_reports, 0)
             self.set_label(self.time_remaining_label, text="Tiempo restante estimado: --:--")
             self.finish_task()
-    def redimensionar_imagen(self, path, max_size=(400, 600)):
-        """Redimensiona una imagen manteniendo la relación de aspecto."""
-        for attempt in range(3):  # Reintentar hasta 3 veces
-            try:
-                img = Image.open(path)
-                
-                # Corregir orientación EXIF
-                exif = img.getexif()
-                if exif:
-                    exif_dict = {ExifTags.get(k, k): v for k, v in exif.items()}
-                    orientation = exif_dict.get('Orientation', 1)
-                    
-                    if orientation == 3:
-                        img = img.rotate(180, expand=True)
-                    elif orientation == 6:
-                        img = img.rotate(270, expand=True)
-                    elif orientation == 8:
-                        img = img.rotate(90, expand=True)
-                
-                # Redimensionar
-                img.thumbnail(max_size, Image.LANCZOS, reducing_gap=3.0)
-                
-                # Guardar temporalmente
-                tmp_path = os.path.join(self.ruta_base, "imagenes_temp", os.path.basename(path))
-                img.save(tmp_path, quality=100, dpi=(600, 600), optimize=True, subsampling=0)
-                img.close()  # Liberar memoria
-                
-                return tmp_path
-            except Exception as e:
-                self.log_message(self.output_reports, f"❌ Error procesando {path} (intento {attempt + 1}): {str(e)}")
-                if attempt == 2:  # Último intento
-                    self.log_message(self.output_reports, f"⚠️ Se omitirá la imagen por errores persistentes: {path}")
-                    return None
-                time.sleep(1)  # Esperar antes de reintentar
-        return None
-    
-    def crear_informe_estacion(self, eid, datos, ruta_base, ruta_temporal):
-        """Crea un informe PDF para una estación, con portada y banner de problemas."""
-        try:
-            carpeta_estacion = os.path.join(ruta_base, eid)
-            nombre_pdf = f"RP-{eid}.pdf"
-            salida_pdf = os.path.join(carpeta_estacion, nombre_pdf)
-            salida_final = os.path.join(carpeta_estacion, f"RP-{eid}-FINAL.pdf")
-            
-            # Rutas de imágenes de fondo
-            fondo_portada_path = os.path.join(ruta_base, "fondo_portada.jpg")
-            fondo_paginas_path = os.path.join(ruta_base, "fondo_paginas.jpg")
-            
-            # Función para fondo dinámico basado en el número de página
-            def fondo_dinamico(canv, doc):
-                canv.saveState()
-                try:
-                    if doc.page == 1 and os.path.exists(fondo_portada_path):
-                        canv.drawImage(fondo_portada_path, 0, 0, width=A4[1], height=A4[0], preserveAspectRatio=True)
-                    elif doc.page > 1 and os.path.exists(fondo_paginas_path):
-                        canv.drawImage(fondo_paginas_path, 0, 0, width=A4[1], height=A4[0], preserveAspectRatio=True)
-                except Exception as e:
-                    self.log_message(self.output_reports, f"⚠️ Error al aplicar fondo en página {doc.page}: {str(e)}")
-                canv.restoreState()
-            
-            # Crear documento PDF con una sola plantilla
-            doc = BaseDocTemplate(salida_pdf, pagesize=landscape(A4))
-            frame = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id="normal")
-            
-            # Plantilla única con fondo dinámico
-            plantilla = PageTemplate(id='unica', frames=[frame], onPage=fondo_dinamico)
-            doc.addPageTemplates([plantilla])
-            
-            styles = getSampleStyleSheet()
-            s_normal = ParagraphStyle("NormalIzq", parent=styles["Normal"], alignment=TA_LEFT, fontSize=10, leading=14)
-            s_titulo = ParagraphStyle("Titulo", parent=styles["Heading3"], textColor=colors.purple, alignment=TA_LEFT, spaceAfter=6)
-            s_banner = ParagraphStyle("Banner", parent=styles["Heading2"], textColor=colors.white, backColor=colors.red, alignment=TA_LEFT, leading=16)
-            
-            story = []
-            
-            # --- Portada ---
-            fecha = datos.get('fecha')
-            fecha_str = fecha.strftime('%d/%m/%Y') if hasattr(fecha, 'strftime') else str(fecha) if fecha else '---'
-            hora_visita = datos.get('hora_visita')
-            hora_visita_str = hora_visita.strftime('%H:%M') if hasattr(hora_visita, 'strftime') else str(hora_visita) if hora_visita else '---'
-            hora_salida = datos.get('hora_salida')
-            hora_salida_str = hora_salida.strftime('%H:%M') if hasattr(hora_salida, 'strftime') else str(hora_salida) if hora_salida else '---'
-            
-            trabajos_realizados = """
-            <b>TRABAJOS DE MANTENIMIENTO REALIZADOS:</b><br/>
-            - Limpieza de áreas verdes.<br/>
-            - Limpieza de casetas.<br/>
-            - Limpieza general.<br/>
-            - Limpieza equipos de acceso y transmisión.<br/>
-            - Revisión de sistemas AC y SPaT.<br/>
-            - Revisión de equipos de energía y baterías.<br/>
-            - Mantenimiento de MG's.<br/>
-            - Mantenimiento de A/A o ventilación forzada.
-            """
-            
-            # Bloque de portada: datos de la estación
-            portada_bloque = []
-            texto_portada = (
-                f"<b>{datos['nombre'].upper()}</b><br/><br/>"
-                f"<b>Tipo:</b> {datos['tipo']}<br/>"
-                f"<b>Coordenadas:</b> {datos['coordenadas']}<br/>"
-                f"<b>Fecha:</b> {fecha_str}<br/>"
-                f"<b>Hora inspección:</b> {hora_visita_str}<br/>"
-                f"<b>Hora salida:</b> {hora_salida_str}<br/><br/>"
-                f"{trabajos_realizados}"
-            )
-            
-            portada_bloque.append(Spacer(1, 60))
-            portada_bloque.append(Paragraph(texto_portada, s_normal))
-            story.extend(portada_bloque)
-            story.append(PageBreak())
-            
-            # --- Contenido de las páginas siguientes ---
-            # Banner rojo si hay problemas
-            if datos.get("estado", "") == "FALLA" or datos.get("problemas", False):
-                story.append(Spacer(1, 6))
-                banner_tabla = Table(
-                    [[Paragraph("ESTACIÓN CON PROBLEMAS", s_banner)]],
-                    colWidths=[doc.width]
-                )
-                banner_tabla.setStyle(TableStyle([
-                    ("BACKGROUND", (0,0), (-1,-1), colors.red),
-                    ("ALIGN", (0,0), (-1,-1), "CENTER"),
-                    ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-                    ("INNERGRID", (0,0), (-1,-1), 0, colors.red),
-                    ("BOX", (0,0), (-1,-1), 0, colors.red),
-                    ("TOPPADDING", (0,0), (-1,-1), 6),
-                    ("BOTTOMPADDING", (0,0), (-1,-1), 6),
-                ]))
-                story.append(banner_tabla)
-                story.append(Spacer(1, 12))
-            
-            # Secciones con fotos
-            orden_secciones = SUBCARPETAS
-            
-            fotos_dict = datos["fotos"]
-            
-            for sec in orden_secciones:
-                fotos = fotos_dict.get(sec, [])
-                if not fotos:
-                    continue
-                
-                for i in range(0, len(fotos), 3):
-                    grupo = fotos[i:i + 3]
-                    fila = []
-                    col_w = []
-                    
-                    for fpath in grupo:
-                        tmp = self.redimensionar_imagen(fpath)
-                        if tmp:
-                            img = ReportLabImage(tmp, width=200, height=300)
-                            fila.append(img)
-                            col_w.append(200)
-                            fila.append(Spacer(1, 12))
-                            col_w.append(12)
-                    
-                    if fila and isinstance(fila[-1], Spacer):
-                        fila.pop(); col_w.pop()
-                    
-                    if not fila:
-                        continue
-                    
-                    tabla = Table([fila], colWidths=col_w)
-                    tabla.setStyle(TableStyle([
-                        ("ALIGN", (0,0), (-1,-1), "CENTER"),
-                        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-                        ("BOTTOMPADDING", (0,0), (-1,-1), 12),
-                        ("TOPPADDING", (0,0), (-1,-1), 12),
-                    ]))
-                    
-                    bloque = [
-                        Paragraph(f"ESTACIÓN: {datos['nombre'].upper()}", s_titulo),
-                        Paragraph(f"SECCIÓN: {sec}", s_titulo),
-                        Spacer(1, 6),
-                        tabla,
-                        Spacer(1, 20)
-                    ]
-                    story.append(KeepTogether(bloque))
-            
-            # Construir PDF
-            doc.build(story)
-            self.log_message(self.output_reports, f"✅ Informe generado: {salida_pdf}")
-            
-            # Combinar con otros PDFs si existen
-            pdfs_a_unir = [salida_pdf]
-            for f in os.listdir(carpeta_estacion):
-                if f.lower().endswith('.pdf') and f != nombre_pdf and "-FINAL" not in f:
-                    pdfs_a_unir.append(os.path.join(carpeta_estacion, f))
-            
-            # Agregar imagen final si existe
-            imagen_final_path = os.path.join(ruta_base, "imagen_final.jpg")
-            if os.path.exists(imagen_final_path):
-                imagen_final_temp_pdf = os.path.join(ruta_temporal, "imagen_final_temp.pdf")
-                self.generar_pdf_imagen_final(imagen_final_path, imagen_final_temp_pdf)
-                pdfs_a_unir.append(imagen_final_temp_pdf)
-            
-            # Unir todos los PDFs
-            salida_resultado = salida_pdf
-            if len(pdfs_a_unir) > 1:
-                merger = PdfMerger()
-                for p in pdfs_a_unir:
-                    merger.append(p)
-                merger.write(salida_final)
-                merger.close()
-                self.log_message(self.output_reports, f"✅ Informe FINAL generado: {salida_final}")
-                salida_resultado = salida_final
-
-            return salida_resultado
-            
-        except Exception as e:
-            self.log_message(self.output_reports, f"❌ Error generando informe para {eid}: {str(e)}")
-            return None
-    
-    def generar_pdf_imagen_final(self, path_img, path_pdf):
-        """Genera un PDF con una sola imagen."""
-        c = canvas.Canvas(path_pdf, pagesize=landscape(A4))
-        c.drawImage(path_img, 0, 0, width=A4[1], height=A4[0])
-        c.showPage()
-        c.save()
 
     def cargar_estaciones_para_seleccion(self):
         try:
@@ -1906,7 +4817,7 @@ class MaintenanceApp(ctk.CTk):
 
 class ReviewDuplicatesWindow(ctk.CTkToplevel):
     """Ventana para revisión manual de duplicados."""
-    def __init__(self, parent, duplicates_groups):
+    def __init__(self, parent, duplicates_groups, similar=False):
         super().__init__(parent)
         self.title("Revisión de Duplicados")
         self.geometry("1100x720")
@@ -1914,8 +4825,16 @@ class ReviewDuplicatesWindow(ctk.CTkToplevel):
         
         self.parent_app = parent
         self.duplicates_groups = duplicates_groups
+        self.similar = similar
+        self.group_kind = "archivos similares" if similar else "archivos idénticos"
         self.current_group_index = 0
         self.current_selection = None
+        self.cards = []                 # Tarjetas reutilizables, una por archivo visible
+        self.thumbnails = OrderedDict()  # {ruta: CTkImage o None si falló}, en orden de uso
+        self.thumbnail_futures = {}     # {ruta: Future} de las miniaturas en carga
+        self.thumbnail_loader = ThreadPoolExecutor(max_workers=REVIEW_THUMBNAIL_WORKERS)
+        # CTkLabel no borra la imagen con image=None: el marcador usa una imagen transparente
+        self.placeholder_image = ctk.CTkImage(light_image=Image.new("RGBA", (1, 1), (0, 0, 0, 0)), size=(1, 1))
         
         self.setup_ui()
         self.show_group(0)
@@ -1996,82 +4915,174 @@ class ReviewDuplicatesWindow(ctk.CTkToplevel):
         )
         self.delete_btn.grid(row=0, column=1, sticky="ew", padx=(12, 0))
 
+        # Los enlaces solo tienen sentido entre copias idénticas byte a byte
+        if not self.similar:
+            self.link_btn = ctk.CTkButton(
+                actions_right,
+                text="Enlazar seleccionadas",
+                command=self.link_selected,
+                state="disabled",
+                height=36
+            )
+            self.link_btn.grid(row=0, column=2, sticky="ew", padx=(12, 0))
+
     def show_group(self, index):
         if index < 0 or index >= len(self.duplicates_groups):
             return
             
+        # Al redibujar el mismo grupo (porque creció) se conservan las marcas
+        previas = {}
+        if index == self.current_group_index:
+            previas = {path: var.get() for path, var in getattr(self, "image_vars", {}).items()}
         self.current_group_index = index
         group = self.duplicates_groups[index]
-        
-        self.group_info.configure(
-            text=f"Grupo {index + 1} de {len(self.duplicates_groups)} · {len(group)} archivos idénticos"
-        )
-        
-        for widget in self.cards_container.winfo_children():
-            widget.destroy()
-        
+
+        # Las tarjetas se reutilizan entre grupos: solo se crean las que falten
+        while len(self.cards) < len(group):
+            self.cards.append(self.create_card())
+        for card in self.cards[len(group):]:
+            card["frame"].pack_forget()
+            card["ruta"] = None
+
         self.image_vars = {}
-        for file_info in group:
-            card = ctk.CTkFrame(self.cards_container, corner_radius=12)
-            card.pack(fill="x", padx=12, pady=8)
-            card.grid_columnconfigure(2, weight=1)
+        for card, file_info in zip(self.cards, group):
+            ruta = file_info['ruta']
+            card["ruta"] = ruta
+            card["var"].set(previas.get(ruta, False))
+            self.image_vars[ruta] = card["var"]
+            card["toggle"].configure(command=lambda v=card["var"], p=ruta: self.on_selection_change(v, p))
+            card["name"].configure(text=file_info['nombre_archivo'])
+            card["info"].configure(text=f"Estación: {file_info['estacion']}  ·  Sección: {file_info['subcarpeta']}")
+            card["path"].configure(text=ruta)
+            card["view"].configure(command=lambda p=ruta: self.view_full_image(p))
+            self.apply_thumbnail(card)
+            if not card["frame"].winfo_manager():
+                card["frame"].pack(fill="x", padx=12, pady=8)
+
+        # Primero las del grupo visible, luego las de los grupos vecinos
+        for vecino in (index, index + 1, index - 1):
+            if 0 <= vecino < len(self.duplicates_groups):
+                for file_info in self.duplicates_groups[vecino]:
+                    self.request_thumbnail(file_info['ruta'])
+        self.discard_far_thumbnails()
+
+        any_selected = any(var.get() for var in self.image_vars.values())
+        self.delete_btn.configure(state="normal" if any_selected else "disabled")
+        if not self.similar:
+            self.link_btn.configure(state=self.delete_btn.cget("state"))
+        self.update_navigation()
+
+    def create_card(self):
+        """Crea una tarjeta vacía; show_group la rellena con el archivo que toque."""
+        card = {"ruta": None, "var": ctk.BooleanVar(value=False)}
+        frame = ctk.CTkFrame(self.cards_container, corner_radius=12)
+        frame.grid_columnconfigure(2, weight=1)
+        card["frame"] = frame
+
+        card["toggle"] = ctk.CTkCheckBox(frame, text="Eliminar", variable=card["var"])
+        card["toggle"].grid(row=0, column=0, rowspan=2, sticky="n", padx=16, pady=16)
+
+        card["image"] = ctk.CTkLabel(frame, text="", width=180, height=180)
+        card["image"].grid(row=0, column=1, rowspan=2, sticky="w", padx=12, pady=12)
+
+        info_block = ctk.CTkFrame(frame, fg_color="transparent")
+        info_block.grid(row=0, column=2, sticky="nw", padx=12, pady=(16, 0))
+        info_block.grid_columnconfigure(0, weight=1)
+        card["name"] = ctk.CTkLabel(info_block, text="", font=ctk.CTkFont(size=14, weight="bold"))
+        card["name"].grid(row=0, column=0, sticky="w")
+        card["info"] = ctk.CTkLabel(
+            info_block,
+            text="",
+            font=ctk.CTkFont(size=12),
+            text_color=("gray70", "gray80")
+        )
+        card["info"].grid(row=1, column=0, sticky="w", pady=(4, 0))
+        card["path"] = ctk.CTkLabel(
+            info_block,
+            text="",
+            font=ctk.CTkFont(size=11),
+            text_color=("gray60", "gray70"),
+            wraplength=640,
+            justify="left"
+        )
+        card["path"].grid(row=2, column=0, sticky="w", pady=(4, 0))
+
+        card["view"] = ctk.CTkButton(frame, text="Abrir imagen", height=32)
+        card["view"].grid(row=1, column=2, sticky="se", padx=12, pady=12)
+        return card
+
+    def apply_thumbnail(self, card):
+        """Muestra en la tarjeta la miniatura cargada, o un marcador mientras llega."""
+        ruta = card["ruta"]
+        if ruta in self.thumbnails:
+            self.thumbnails.move_to_end(ruta)
+            img_ctk = self.thumbnails[ruta]
+            if img_ctk is None:
+                card["image"].configure(image=self.placeholder_image, text="Vista previa no disponible", text_color="red")
+            else:
+                card["image"].configure(image=img_ctk, text="")
+        else:
+            card["image"].configure(image=self.placeholder_image, text="Cargando...", text_color=("gray60", "gray70"))
 
-            var = ctk.BooleanVar(value=False)
-            self.image_vars[file_info['ruta']] = var
-            
-            toggle = ctk.CTkCheckBox(
-                card,
-                text="Eliminar",
-                variable=var,
-                command=lambda v=var, p=file_info['ruta']: self.on_selection_change(v, p)
-            )
-            toggle.grid(row=0, column=0, rowspan=2, sticky="n", padx=16, pady=16)
-            
-            try:
-                img = Image.open(file_info['ruta'])
-                img.thumbnail((180, 180))
-                img_ctk = ctk.CTkImage(light_image=img, size=(180, 180))
-                img_label = ctk.CTkLabel(card, image=img_ctk, text="")
-                img_label.image = img_ctk
-                img_label.grid(row=0, column=1, rowspan=2, sticky="w", padx=12, pady=12)
-            except Exception as e:
-                img_label = ctk.CTkLabel(card, text="Vista previa no disponible", text_color="red")
-                img_label.grid(row=0, column=1, rowspan=2, sticky="w", padx=12, pady=12)
-                self.parent_app.log_message(self.parent_app.output_duplicates, f"Error al cargar imagen para vista previa: {str(e)}")
-
-            info_block = ctk.CTkFrame(card, fg_color="transparent")
-            info_block.grid(row=0, column=2, sticky="nw", padx=12, pady=(16, 0))
-            info_block.grid_columnconfigure(0, weight=1)
-            ctk.CTkLabel(
-                info_block,
-                text=file_info['nombre_archivo'],
-                font=ctk.CTkFont(size=14, weight="bold")
-            ).grid(row=0, column=0, sticky="w")
-            ctk.CTkLabel(
-                info_block,
-                text=f"Estación: {file_info['estacion']}  ·  Sección: {file_info['subcarpeta']}",
-                font=ctk.CTkFont(size=12),
-                text_color=("gray70", "gray80")
-            ).grid(row=1, column=0, sticky="w", pady=(4, 0))
-            ctk.CTkLabel(
-                info_block,
-                text=file_info['ruta'],
-                font=ctk.CTkFont(size=11),
-                text_color=("gray60", "gray70"),
-                wraplength=640,
-                justify="left"
-            ).grid(row=2, column=0, sticky="w", pady=(4, 0))
-            
-            view_btn = ctk.CTkButton(
-                card,
-                text="Abrir imagen",
-                command=lambda p=file_info['ruta']: self.view_full_image(p),
-                height=32
-            )
-            view_btn.grid(row=1, column=2, sticky="se", padx=12, pady=12)
-        
+    def request_thumbnail(self, ruta):
+        """Encarga la miniatura de ruta al grupo de hilos si no está cargada ni pedida."""
+        if ruta in self.thumbnails or ruta in self.thumbnail_futures:
+            return
+        future = self.thumbnail_loader.submit(self.parent_app.thumbnail_cache.get, ruta, 180)
+        self.thumbnail_futures[ruta] = future
+        future.add_done_callback(lambda f, p=ruta: self.parent_app.call_on_ui(self.on_thumbnail_loaded, p, f))
+
+    def on_thumbnail_loaded(self, ruta, future):
+        """Recibe en el hilo de Tk una miniatura terminada y la coloca si está a la vista."""
+        if self.thumbnail_futures.get(ruta) is not future or not self.winfo_exists():
+            return
+        del self.thumbnail_futures[ruta]
+        if future.cancelled():
+            return
+        try:
+            img = future.result()
+            self.thumbnails[ruta] = ctk.CTkImage(light_image=img, size=img.size)
+        except Exception as e:
+            self.thumbnails[ruta] = None
+            self.parent_app.log_message(self.parent_app.output_duplicates, f"Error al cargar imagen para vista previa: {str(e)}")
+        for card in self.cards:
+            if card["ruta"] == ruta:
+                self.apply_thumbnail(card)
+
+    def discard_far_thumbnails(self):
+        """Cancela las cargas de grupos lejanos y limita las miniaturas en memoria."""
+        cercanas = {
+            file_info['ruta']
+            for vecino in range(self.current_group_index - 1, self.current_group_index + 2)
+            if 0 <= vecino < len(self.duplicates_groups)
+            for file_info in self.duplicates_groups[vecino]
+        }
+        for ruta in [r for r in self.thumbnail_futures if r not in cercanas]:
+            # cancel() dispara el callback, que puede haber quitado ya la entrada
+            if self.thumbnail_futures[ruta].cancel():
+                self.thumbnail_futures.pop(ruta, None)
+        while len(self.thumbnails) > max(REVIEW_THUMBNAILS_IN_MEMORY, len(cercanas)):
+            self.thumbnails.popitem(last=False)
+
+    def destroy(self):
+        self.thumbnail_loader.shutdown(wait=False, cancel_futures=True)
+        super().destroy()
+
+    def update_navigation(self):
+        index = self.current_group_index
+        group = self.duplicates_groups[index]
+        self.group_info.configure(
+            text=f"Grupo {index + 1} de {len(self.duplicates_groups)} · {len(group)} {self.group_kind}"
+        )
         self.prev_btn.configure(state="normal" if index > 0 else "disabled")
         self.next_btn.configure(state="normal" if index < len(self.duplicates_groups) - 1 else "disabled")
+
+    def refresh_groups(self):
+        """Actualiza la ventana cuando la búsqueda en curso agrega grupos o archivos."""
+        if len(self.duplicates_groups[self.current_group_index]) != len(self.image_vars):
+            self.show_group(self.current_group_index)
+        else:
+            self.update_navigation()
         
     def on_selection_change(self, var, path):
         if var.get():
@@ -2082,6 +5093,8 @@ class ReviewDuplicatesWindow(ctk.CTkToplevel):
             # Verificar si hay alguna selección
             any_selected = any(var.get() for var in self.image_vars.values())
             self.delete_btn.configure(state="normal" if any_selected else "disabled")
+        if not self.similar:
+            self.link_btn.configure(state=self.delete_btn.cget("state"))
     
     def view_full_image(self, path):
         """Abre la imagen en el visor predeterminado del sistema."""
@@ -2144,7 +5157,327 @@ class ReviewDuplicatesWindow(ctk.CTkToplevel):
                 messagebox.showinfo("Completado", "Revisión de todos los grupos completada.")
                 self.destroy()
 
+    def link_selected(self):
+        """Reemplaza las fotos seleccionadas por enlaces a la primera del grupo."""
+        canonica = self.duplicates_groups[self.current_group_index][0]['ruta']
+        selected_files = [path for path, var in self.image_vars.items() if var.get() and path != canonica]
+
+        if not selected_files:
+            messagebox.showwarning("Advertencia", "No hay copias seleccionadas para enlazar.")
+            return
+
+        confirm = messagebox.askyesno(
+            "Confirmar enlace",
+            f"¿Reemplazar {len(selected_files)} foto(s) por enlaces a la primera del grupo?\n\n"
+            "Las fotos se mantienen en sus secciones y el cambio puede deshacerse desde la pestaña de duplicados."
+        )
+        if not confirm:
+            return
+
+        # La verificación byte a byte y los enlaces van en segundo plano para no congelar la ventana
+        if not self.parent_app.run_background_task(
+            self._link_selected_thread, "enlace de duplicados",
+            self.current_group_index, canonica, selected_files
+        ):
+            return
+        self.parent_app.toggle_buttons(False)
+        self.delete_btn.configure(state="disabled")
+        self.link_btn.configure(state="disabled")
+        self.parent_app.set_label(self.parent_app.status_label, text="Enlazando duplicados...", text_color="orange")
+
+    def _link_selected_thread(self, indice, canonica, selected_files):
+        app = self.parent_app
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        journal = Path(app.ruta_base) / REPORTS_DIRNAME / f"{RECLAIM_JOURNAL_PREFIX}{timestamp}.jsonl"
+        errores = []
+        reclaimer = None
+        try:
+            reclaimer = DuplicateReclaimer(
+                journal,
+                method=app.preferences.get("reclaim_method", DEFAULT_RECLAIM_METHOD),
+                cancel_event=app.cancel_event,
+            )
+            for ruta, metodo, error in reclaimer.reclaim_group([canonica] + selected_files):
+                if error:
+                    errores.append(f"{ruta}: {error}")
+                    app.log_message(app.output_duplicates, f"No se enlazó {ruta}: {error}")
+                elif metodo:
+                    app.log_message(app.output_duplicates, f"Enlazado ({metodo}): {ruta}")
+            app.set_label(app.status_label, text="Duplicados enlazados.", text_color="green")
+        except Exception as e:
+            errores.append(str(e))
+            app.set_label(app.status_label, text="Error al enlazar duplicados.", text_color="red")
+        finally:
+            if reclaimer is not None:
+                reclaimer.close()
+            app.finish_task()
+        enlazados = reclaimer.enlazados if reclaimer is not None else 0
+        app.call_on_ui(self.on_link_finished, indice, enlazados, errores)
+
+    def on_link_finished(self, indice, enlazados, errores):
+        """Informa en el hilo de Tk el resultado de link_selected y pasa al siguiente grupo."""
+        if not self.winfo_exists():
+            return
+        if errores:
+            messagebox.showwarning(
+                "Enlace incompleto",
+                f"Se enlazaron {enlazados} foto(s), pero no se pudo enlazar:\n" + "\n".join(errores)
+            )
+        else:
+            messagebox.showinfo("Éxito", f"Se enlazaron {enlazados} foto(s).")
+
+        if indice != self.current_group_index:
+            self.show_group(self.current_group_index)
+        elif self.current_group_index < len(self.duplicates_groups) - 1:
+            self.next_group()
+        else:
+            messagebox.showinfo("Completado", "Revisión de todos los grupos completada.")
+            self.destroy()
+
+def run_hash_benchmark(args):
+    """Ejecuta el micro-benchmark de hashing sobre una muestra de imágenes."""
+    rutas = []
+    for root, _, files in os.walk(args.carpeta):
+        rutas.extend(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+    if not rutas:
+        print(f"No se encontraron imágenes en {args.carpeta}", file=sys.stderr)
+        return 1
+    muestra = random.Random(0).sample(rutas, min(args.muestras, len(rutas)))
+    resultados = benchmark_hash_engines(muestra)
+    if not resultados:
+        print("No se pudo medir: las imágenes de muestra están vacías.", file=sys.stderr)
+        return 1
+    for velocidad, algoritmo, estrategia, bloque in resultados:
+        print(f"{algoritmo:8s} {estrategia:9s} {bloque // 1024:5d} KB  {velocidad:9.1f} MB/s")
+    _, algoritmo, estrategia, bloque = resultados[0]
+    print(f"Más rápido: {algoritmo}/{estrategia}/{bloque // 1024} KB")
+    if args.guardar or args.cambiar_algoritmo:
+        preferences = load_config()
+        if args.cambiar_algoritmo:
+            actual = preferences.get("hash_algorithm", DEFAULT_HASH_ALGORITHM)
+            preferences["hash_algorithm"] = algoritmo
+            if algoritmo != actual:
+                print(
+                    f"Aviso: el algoritmo cambia de {actual} a {algoritmo}; el caché de hashes guardado con "
+                    f"{actual} deja de servir y todas las fotos se volverán a leer en el próximo análisis.",
+                    file=sys.stderr,
+                )
+        else:
+            # Cambiar el algoritmo invalida el caché: solo se ajusta la lectura del algoritmo configurado
+            algoritmo = preferences.get("hash_algorithm", DEFAULT_HASH_ALGORITHM)
+            propios = [fila for fila in resultados if fila[1] == algoritmo]
+            if not propios:
+                print(f"No se midió el algoritmo configurado ({algoritmo}); no se guardó nada.", file=sys.stderr)
+                return 1
+            _, _, estrategia, bloque = propios[0]
+        preferences.update(hash_strategy=estrategia, hash_block_size=bloque)
+        save_config(preferences)
+        print(f"Configuración guardada en {APP_CONFIG_FILE}: {algoritmo}/{estrategia}/{bloque // 1024} KB")
+    return 0
+
+
+def run_duplicate_scan(args):
+    """Analiza duplicados sin interfaz y escribe cada archivo duplicado según se detecta.
+
+    Cada registro (NDJSON o CSV) es un archivo con la clave de su grupo; al
+    formarse un grupo se escriben sus dos primeros archivos y luego uno por
+    cada archivo que se suma. El resumen se escribe en stderr.
+    """
+    base_path = Path(os.path.abspath(args.carpeta))
+    if not base_path.is_dir():
+        print(f"No existe la carpeta {args.carpeta}", file=sys.stderr)
+        return 1
+    preferences = load_config()
+    store = HashCacheStore(
+        args.cache,
+        legacy_json=HASH_CACHE_FILE,
+        identity_fallback=bool(preferences.get("hash_identity_fallback", True)),
+    )
+    hashing = CachedHashing(
+        store,
+        FileHasher.from_preferences(preferences),
+        preferences.get("perceptual_method", DEFAULT_PERCEPTUAL_METHOD),
+    )
+    salida = open(args.salida, "w", encoding="utf-8", newline="") if args.salida else sys.stdout
+    escritor = csv.writer(salida) if args.formato == "csv" else None
+    if escritor:
+        escritor.writerow(["grupo", "ruta", "tamano", "mtime"])
+    cancel_event = threading.Event()
+    try:
+        store.register_root(base_path)
+        previo = store.load_snapshot(base_path) if args.incremental else None
+        snapshot, _, _ = escanear_arbol(base_path, previo)
+        store.save_snapshot(base_path, snapshot)
+        entradas = {entrada.ruta: entrada for entrada in snapshot.archivos()}
+        archivos_duplicados = 0
+
+        def escribir_grupo(clave, rutas):
+            nonlocal archivos_duplicados
+            for ruta in rutas:
+                entrada = entradas[ruta]
+                if entrada.mtime is None:  # Carpeta reutilizada: se lee el stat real solo de los duplicados
+                    datos_stat = CachedHashing.stat(ruta)
+                    if datos_stat is not None:
+                        entrada = entrada._replace(tamano=datos_stat[0], mtime=datos_stat[1])
+                if escritor:
+                    escritor.writerow([clave, ruta, entrada.tamano, entrada.mtime])
+                else:
+                    salida.write(json.dumps(
+                        {"grupo": clave, "ruta": ruta, "tamano": entrada.tamano, "mtime": entrada.mtime},
+                        ensure_ascii=False,
+                    ) + "\n")
+                archivos_duplicados += 1
+            salida.flush()
+
+        similares = args.modo == "similares"
+        finder = hashing.make_finder(
+            similares,
+            args.tolerancia,
+            max_workers=args.hilos,
+            cancel_event=cancel_event,
+            on_group=escribir_grupo,
+        )
+        inicio = time.perf_counter()
+        grupos = finder.find(entradas.values())
+        eliminadas = store.purge_missing(base_path, entradas.keys())
+        resumen = (
+            f"{len(entradas)} imágenes, {len(grupos)} grupos, {archivos_duplicados} archivos duplicados"
+            f" en {time.perf_counter() - inicio:.1f} s"
+        )
+        if not similares:
+            resumen += f", {finder.bytes_leidos / (1024 * 1024):.1f} MB leídos"
+        if eliminadas:
+            resumen += f", {eliminadas} entradas de caché obsoletas"
+        print(resumen, file=sys.stderr)
+    except KeyboardInterrupt:
+        cancel_event.set()
+        print("Análisis cancelado.", file=sys.stderr)
+        return 130
+    except BrokenPipeError:
+        # El consumidor cerró la salida (por ejemplo, head): se termina sin error
+        cancel_event.set()
+        if salida is sys.stdout:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except (OSError, sqlite3.Error) as exc:
+        print(f"Error durante el análisis: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+        if salida is not sys.stdout:
+            salida.close()
+    return 0
+
+
+def run_history_register(args):
+    """Registra una carpeta de mes en el historial global de fotos."""
+    if not Path(args.carpeta).is_dir():
+        print(f"No existe la carpeta {args.carpeta}", file=sys.stderr)
+        return 1
+    preferences = load_config()
+    store = HashCacheStore(args.cache, legacy_json=HASH_CACHE_FILE)
+    hashing = CachedHashing(
+        store,
+        FileHasher.from_preferences(preferences),
+        preferences.get("perceptual_method", DEFAULT_PERCEPTUAL_METHOD),
+    )
+    try:
+        nombre = args.nombre or nombre_mes(args.carpeta)
+        fotos = HistoryIndex(store, hashing, max_workers=args.hilos).register(
+            args.carpeta, nombre, perceptual=args.perceptual
+        )
+        print(f"{nombre} registrado en el historial: {fotos} fotos")
+        for mes, carpeta, total in store.list_months():
+            print(f"  {mes:24s} {total:6d} fotos  {carpeta}")
+    except KeyboardInterrupt:
+        print("Registro cancelado.", file=sys.stderr)
+        return 130
+    except (OSError, sqlite3.Error) as exc:
+        print(f"Error durante el registro: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+def run_cache_bundle(args):
+    """Exporta o importa el paquete de caché de hashes de una carpeta base."""
+    store = HashCacheStore(HASH_CACHE_DB, legacy_json=HASH_CACHE_FILE)
+    try:
+        if args.comando == "cache-exportar":
+            total = store.export_bundle(args.carpeta, args.archivo)
+            print(f"Caché exportado: {total} entradas en {args.archivo}")
+        else:
+            total = store.import_bundle(args.carpeta, args.archivo)
+            print(f"Caché importado: {total} entradas fusionadas")
+    except (OSError, ValueError, sqlite3.Error) as exc:
+        print(f"Error con el caché: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+def entero_positivo(valor):
+    """Tipo de argparse para cantidades que deben ser al menos 1."""
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"se esperaba un entero: {valor!r}")
+    if numero < 1:
+        raise argparse.ArgumentTypeError(f"debe ser al menos 1: {numero}")
+    return numero
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gestor de mantenimiento preventivo")
+    subparsers = parser.add_subparsers(dest="comando")
+    bench = subparsers.add_parser("benchmark-hash", help="Mide y elige el motor de hash más rápido")
+    bench.add_argument("carpeta", help="Carpeta con imágenes de muestra")
+    bench.add_argument("--muestras", type=entero_positivo, default=40, help="Cantidad de imágenes a medir")
+    bench.add_argument("--guardar", action="store_true",
+                       help="Guardar la lectura y el bloque más rápidos para el algoritmo configurado")
+    bench.add_argument("--cambiar-algoritmo", action="store_true",
+                       help="Guardar también el algoritmo más rápido (invalida el caché de hashes)")
+    exportar = subparsers.add_parser("cache-exportar", help="Exporta el caché de hashes de una carpeta base")
+    exportar.add_argument("carpeta", help="Carpeta base del árbol de trabajo")
+    exportar.add_argument("archivo", help="Paquete de caché a crear")
+    importar = subparsers.add_parser("cache-importar", help="Fusiona un paquete de caché exportado en otro equipo")
+    importar.add_argument("carpeta", help="Carpeta base del árbol de trabajo")
+    importar.add_argument("archivo", help="Paquete de caché a importar")
+    duplicados = subparsers.add_parser("duplicados", help="Busca fotos duplicadas sin abrir la interfaz")
+    duplicados.add_argument("carpeta", help="Carpeta base a analizar")
+    duplicados.add_argument("--modo", choices=("exactos", "similares"), default="exactos", help="Tipo de coincidencia")
+    duplicados.add_argument("--tolerancia", type=int, default=DEFAULT_SIMILARITY_THRESHOLD,
+                            help="Distancia de Hamming máxima en modo similares")
+    duplicados.add_argument("--hilos", type=entero_positivo, default=None, help="Cantidad de hilos de trabajo")
+    duplicados.add_argument("--formato", choices=("ndjson", "csv"), default="ndjson", help="Formato de salida")
+    duplicados.add_argument("--salida", help="Archivo de salida (por defecto, la salida estándar)")
+    duplicados.add_argument("--incremental", action="store_true",
+                            help="Releer solo las carpetas modificadas desde el último análisis")
+    duplicados.add_argument("--cache", default=HASH_CACHE_DB, help="Base SQLite del caché de hashes")
+    historial = subparsers.add_parser("historial-registrar", help="Agrega una carpeta de mes al historial global")
+    historial.add_argument("carpeta", help="Carpeta del mes a registrar")
+    historial.add_argument("--nombre", help="Nombre del mes en el historial (por defecto, las dos últimas carpetas)")
+    historial.add_argument("--perceptual", action="store_true", help="Guardar también huellas perceptuales")
+    historial.add_argument("--hilos", type=entero_positivo, default=None, help="Cantidad de hilos de trabajo")
+    historial.add_argument("--cache", default=HASH_CACHE_DB, help="Base SQLite del caché de hashes")
+    args = parser.parse_args(argv)
+
+    if args.comando == "historial-registrar":
+        return run_history_register(args)
+    if args.comando == "duplicados":
+        return run_duplicate_scan(args)
+    if args.comando == "benchmark-hash":
+        return run_hash_benchmark(args)
+    if args.comando in ("cache-exportar", "cache-importar"):
+        return run_cache_bundle(args)
 
-if __name__ == "__main__":
     app = MaintenanceApp()
     app.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Los procesos de informes arrancan bien en ejecutables empaquetados
+    sys.exit(main())